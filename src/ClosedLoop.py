@@ -29,6 +29,11 @@ class ClosedLoop:
         self.kp = kp
         self.setpoint = setpoint
         
+        # Scale for the integer path; None until set_tick_scale() is called
+        self.rad_per_tick = None
+        self.kp_q = 0
+        self.setpoint_ticks = 0
+        
     def update(self, measured):
         '''!
         @brief              Updates the control signal based on the current error
@@ -40,6 +45,37 @@ class ClosedLoop:
         # Calculate error and return proportional control signal
         error = self.setpoint - measured
         return self.kp*error
+    
+    def set_tick_scale(self, rad_per_tick):
+        '''!
+        @brief              Prepares the controller to work in encoder ticks
+        @details            The gain is converted to a Q16 fixed-point number
+                            of [% duty cycle/tick] and the setpoint to ticks,
+                            so that @c update_ticks() uses only integers
+        @param rad_per_tick Output shaft angle of one encoder tick [rad]
+        '''
+        self.rad_per_tick = rad_per_tick
+        self.kp_q = int(round(self.kp * rad_per_tick * 65536))
+        self.setpoint_ticks = int(round(self.setpoint / rad_per_tick))
+    
+    def update_ticks(self, measured):
+        '''!
+        @brief              Updates the control signal using integer positions
+        @details            Like @c update(), but the position is in encoder
+                            ticks and the result is an integer duty cycle, so
+                            no memory is allocated. @c set_tick_scale() must
+                            be called first
+        @param measured     The current position of the system [ticks]
+        @return             The duty cycle [%]
+        '''
+        
+        # Calculate error and return proportional control signal, removing
+        # the 16 fractional bits of the gain from the product. Rounding is
+        # toward zero like int() so the duty is symmetric about the setpoint
+        error = self.setpoint_ticks - measured
+        if error < 0:
+            return -((-self.kp_q*error) >> 16)
+        return (self.kp_q*error) >> 16
         
     def change_setpoint(self, setpoint):
         '''!
@@ -48,6 +84,8 @@ class ClosedLoop:
         '''
         
         self.setpoint = setpoint
+        if self.rad_per_tick:
+            self.set_tick_scale(self.rad_per_tick)
         
     def change_kp(self, kp):
         '''!
@@ -55,4 +93,6 @@ class ClosedLoop:
         @param kp    The new proportional gain for the controller [% duty cycle/rad]
         '''
         
-        self.kp = kp
\ No newline at end of file
+        self.kp = kp
+        if self.rad_per_tick:
+            self.set_tick_scale(self.rad_per_tick)
\ No newline at end of file
@@ -8,15 +8,49 @@
     @date       Last Modified 1/26/22
 '''
 
+import array
 import pyb
 import utime
 
+## Gear ratio between the motor and the output shaft
+GEAR_RATIO = 16
+
+## Encoder counts per revolution of the motor
+CPR = 256
+
+## Output shaft angle [rad] per encoder tick, computed once at import so that
+#  conversions are a single multiply
+RAD_PER_TICK = 3.1415926535 / (GEAR_RATIO*CPR)
+
+def to_rad(ticks):
+    '''!
+    @brief          Converts a position in encoder ticks to radians
+    @param ticks    Position of the output shaft [ticks]
+    @return         Position of the output shaft [rad]
+    '''
+    return ticks * RAD_PER_TICK
+
+def to_ticks(rad):
+    '''!
+    @brief          Converts a position in radians to the nearest encoder tick
+    @param rad      Position of the output shaft [rad]
+    @return         Position of the output shaft [ticks]
+    '''
+    return int(round(rad / RAD_PER_TICK))
+
+## Minimum change in position [ticks] across the velocity window for the
+#  window estimate to be used; below this the time between changes is used
+VEL_MIN_TICKS = 4
+
+## Time [us] without a change in position after which velocity is zero
+VEL_STOP_US = 500000
+
 class EncoderDriver:
     '''! 
     This class implements an encoder driver for an ME405 kit. 
     '''
     
-    def __init__ (self, in1pin, in2pin, timer):
+    def __init__ (self, in1pin, in2pin, timer, window = 4):
         '''! 
         @brief          Creates an encoder driver object
         @details        Creates an encoder driver by initializing timers and channels with 
@@ -24,6 +58,7 @@ class EncoderDriver:
         @param in1pin   A pyb.Pin object corresponding to the encoder channel A 
         @param in2pin   A pyb.Pin object corresponding to the encoder channel B
         @param timer    The timer number corresponding to the encoder pins
+        @param window   Number of updates over which velocity is estimated
         '''
         
         # Create timer and timer channels in encoder mode
@@ -31,43 +66,137 @@ class EncoderDriver:
         self.ch1 = self.timer.channel(1, pyb.Timer.ENC_A, pin = in1pin)
         self.ch2 = self.timer.channel(2, pyb.Timer.ENC_B, pin = in2pin)
         
-        # Stores current encoder position in radians
+        # Stores current encoder position in ticks
         self.current_position = 0
         self.delta = 0
         
+        # Positions [ticks] and times [us] of the last few updates, used to
+        # estimate velocity over a fixed window
+        self.window = window
+        self.pos_hist = array.array('l', [0] * window)
+        self.time_hist = array.array('l', [0] * window)
+        self.hist_idx = 0
+        self.hist_num = 0
+        
+        # Time of the last update at which the position changed, the time
+        # between the last two such updates and the change in position then
+        self.last_time = 0
+        self.edge_time = 0
+        self.edge_period = 0
+        self.edge_ticks = 0
+        
 
-    def update(self):
+    def update(self, now = None, count = None):
         '''!
         @brief      Updates the position of the encoder 
         @details    Updates the position of the encoder using saved last value
                     Checks for a 'valid' delta and adjusts if needed, then adds
-                    delta to previous position 
+                    delta to previous position. The position and time are
+                    saved for the velocity estimate
+        @param now  Time of the reading from @c utime.ticks_us(), or @c None
+                    to read the time here
+        @param count A reading of the timer counter taken earlier, such as by
+                    an @c EncoderSampler, or @c None to read the counter here
         '''
+        if now is None:
+            now = utime.ticks_us()
+        if count is None:
+            count = self.timer.counter()
 
-        prev_position = self.current_position % 65535
-        self.delta = self.timer.counter() - prev_position
+        # The counter holds the low 16 bits of the position. Only integers
+        # are used so that no memory is allocated
+        prev_position = self.current_position & 0xFFFF
+        self.delta = count - prev_position
         
         # Validate and adjust delta
-        if self.delta < -65535/2:
-            self.delta += 65535
-        elif self.delta > 65535/2:
-            self.delta -= 65535
+        if self.delta < -32768:
+            self.delta += 65536
+        elif self.delta > 32768:
+            self.delta -= 65536
         
         # Update position
         self.current_position += self.delta
+        self.last_time = now
+        
+        # Save position and time in the velocity window, overwriting the oldest
+        self.pos_hist[self.hist_idx] = self.current_position
+        self.time_hist[self.hist_idx] = now
+        self.hist_idx += 1
+        if self.hist_idx >= self.window:
+            self.hist_idx = 0
+        if self.hist_num < self.window:
+            self.hist_num += 1
+        
+        # Keep the time between changes for the low speed estimate
+        if self.delta:
+            if self.hist_num > 1:
+                self.edge_period = utime.ticks_diff(now, self.edge_time)
+                self.edge_ticks = self.delta
+            self.edge_time = now
         return self.current_position
     
     def read (self):
         '''!
         @brief      Returns current position of encoder
         @details    Converts the current encoder position reading (in ticks)
-                    to radians using the encoder CPR and gear ratio
+                    to radians using the encoder CPR and gear ratio. This
+                    creates a float, so @c read_ticks() should be used in
+                    fast loops
         '''
-        gearRatio = 16
-        CPR = 256
-        
-        return self.current_position * 3.1415926535 / (gearRatio*CPR)
+        return self.current_position * RAD_PER_TICK
+    
+    def read_ticks (self):
+        '''!
+        @brief      Returns current position of encoder in ticks
+        @details    The position is a small integer, so reading it doesn't
+                    allocate memory. It can be converted to radians with
+                    @c to_rad() when it is reported
+        '''
+        return self.current_position
     
+    def velocity (self):
+        '''!
+        @brief      Returns the estimated velocity of the encoder
+        @details    The change in position across the window of recent updates
+                    is divided by the time it took. At low speeds, when the
+                    position changes by only a few ticks across the window,
+                    the time between the last two changes is used instead.
+                    If no change has been seen for longer than that time, the
+                    velocity can be no more than one tick per time since the
+                    last change, so it falls to zero smoothly as a motor stops.
+                    Only integers are used so that no memory is allocated; the
+                    result can be converted to radians per second with
+                    @c to_rad() when it is reported
+        @return     Velocity of the output shaft [ticks/s], rounded toward zero
+        '''
+        if self.hist_num < 2:
+            return 0
+        
+        # Oldest and newest samples in the window
+        newest = self.hist_idx - 1 if self.hist_idx else self.window - 1
+        oldest = self.hist_idx if self.hist_num == self.window else 0
+        ticks = self.pos_hist[newest] - self.pos_hist[oldest]
+        period = utime.ticks_diff(self.time_hist[newest], self.time_hist[oldest])
+        
+        if -VEL_MIN_TICKS < ticks < VEL_MIN_TICKS and self.edge_period:
+            since = utime.ticks_diff(self.last_time, self.edge_time)
+            if since > VEL_STOP_US:
+                return 0
+            ticks = self.edge_ticks
+            period = max(self.edge_period, since)
+        
+        # Over a second or more the speed is at most a few ticks per second,
+        # or the task has stalled, so the estimate is taken as zero
+        if period <= 0 or period >= 1000000:
+            return 0
+        
+        # Multiplying by 1000000 at once could make a number too large for a
+        # small integer, so the division is done in two steps, on the size
+        # of the change so that it rounds toward zero either way
+        size = ticks if ticks >= 0 else -ticks
+        size *= 1000
+        rate = (size // period) * 1000 + (size % period) * 1000 // period
+        return rate if ticks >= 0 else -rate
 
     def zero(self):
         '''!
@@ -78,6 +207,11 @@ class EncoderDriver:
         self.delta = 0
         self.timer.counter(0)
         
+        # Old samples would make a false velocity from the jump to zero
+        self.hist_idx = 0
+        self.hist_num = 0
+        self.edge_period = 0
+        
         
 if __name__ == "__main__":
     
@@ -90,4 +224,5 @@ if __name__ == "__main__":
         if (utime.ticks_ms() > (time + 500)):
             print("\ntimer counter:", encoder2.timer.counter())
             print("\nencoder driver", encoder2.read())
+            print("\nvelocity [rad/s]", to_rad(encoder2.velocity()))
             time += 500
\ No newline at end of file
@@ -0,0 +1,189 @@
+''' @file       EncoderSampler.py
+    @brief      Samples an encoder counter from a timer interrupt
+    @details    A timer callback reads the encoder counter at a fixed high
+                rate into a preallocated ring buffer of (time, count) pairs.
+                The encoder task then takes the samples out in batches and
+                feeds them to an EncoderDriver, so the position is known at
+                the sampling rate however late the task runs. The module
+                doesn't use pyb, so it can be run on a PC with a SimCounter
+                and a cotask.SimTimer
+    @author     Jonathan Cederquist
+    @author     Tim Jain
+    @author     Philip Pang
+    @date       Last Modified 2/17/22
+'''
+
+import array
+import utime
+
+class EncoderSampler:
+    '''!
+    @brief      Saves encoder counter readings taken in a timer interrupt
+    @details    Only the interrupt changes the write index and only the task
+                changes the read index, so interrupts never need to be
+                disabled. One slot is always left empty so that a full buffer
+                can be told from an empty one. If the task falls so far
+                behind that the buffer fills, new samples are dropped and
+                counted
+    '''
+
+    def __init__ (self, counter, timer, size = 256):
+        '''!
+        @brief          Creates a sampler and allocates its buffer
+        @param counter  An object whose @c counter() method returns the
+                        encoder count, such as the @c pyb.Timer of an
+                        EncoderDriver or a SimCounter
+        @param timer    A timer whose @c callback() method sets the function
+                        called at the sampling rate, such as a @c pyb.Timer
+                        or a @c cotask.SimTimer
+        @param size     Number of samples the buffer can hold
+        '''
+        self.counter = counter
+        self.timer = timer
+        self.slots = size + 1
+        self.times = array.array('l', [0] * self.slots)
+        self.counts = array.array('H', [0] * self.slots)
+        self.wr_idx = 0
+        self.rd_idx = 0
+        self.dropped = 0
+
+        # Making a bound method allocates memory, so it's done once here
+        # rather than each time the callback is set
+        self._sample_cb = self._sample
+
+    def start (self):
+        '''!
+        @brief      Starts taking samples in the timer interrupt
+        '''
+        self.timer.callback(self._sample_cb)
+
+    def stop (self):
+        '''!
+        @brief      Stops taking samples
+        '''
+        self.timer.callback(None)
+
+    def _sample (self, timer):
+        '''!
+        @brief      Timer callback which saves one reading of the counter
+        @details    This doesn't allocate memory, so it may run in an ISR
+        @param timer The timer which caused the interrupt (not used)
+        '''
+        nxt = self.wr_idx + 1
+        if nxt >= self.slots:
+            nxt = 0
+        if nxt == self.rd_idx:
+            self.dropped += 1
+            return
+        self.times[self.wr_idx] = utime.ticks_us()
+        self.counts[self.wr_idx] = self.counter.counter()
+        self.wr_idx = nxt
+
+    def num_in (self):
+        '''!
+        @brief      Returns the number of samples waiting to be taken out
+        '''
+        num = self.wr_idx - self.rd_idx
+        if num < 0:
+            num += self.slots
+        return num
+
+    def last (self):
+        '''!
+        @brief      Returns the newest sample without taking anything out
+        @return     A tuple of the time [us] and count of the newest sample,
+                    or @c None if no samples are waiting
+        '''
+        if self.wr_idx == self.rd_idx:
+            return None
+        idx = self.wr_idx - 1 if self.wr_idx else self.slots - 1
+        return (self.times[idx], self.counts[idx])
+
+    def clear (self):
+        '''!
+        @brief      Discards the waiting samples
+        @details    This should be called after the encoder is zeroed, since
+                    samples taken before then hold the old counts
+        '''
+        self.rd_idx = self.wr_idx
+
+    def drain (self, encoder, log = None):
+        '''!
+        @brief          Feeds all the waiting samples to an encoder driver
+        @details        The samples are given to @c encoder.update() in the
+                        order they were taken, so its position and velocity
+                        estimate follow the encoder at the sampling rate
+        @param encoder  The EncoderDriver which uses the samples
+        @param log      An optional RecordQueue with format @c 'ii' into
+                        which the time [us] and position [ticks] of each
+                        sample are put, if there's room
+        @return         The number of samples taken out
+        '''
+        num = 0
+        wr_idx = self.wr_idx
+        while self.rd_idx != wr_idx:
+            idx = self.rd_idx
+            position = encoder.update(self.times[idx], self.counts[idx])
+            if log:
+                log.try_put(self.times[idx], position)
+            idx += 1
+            if idx >= self.slots:
+                idx = 0
+            self.rd_idx = idx
+            num += 1
+        return num
+
+
+class SimCounter:
+    '''!
+    @brief      A stand-in for an encoder timer counter, used on a PC
+    @details    The count changes at a set rate with time, wrapping at 16
+                bits like the counter of a timer in encoder mode
+    '''
+
+    def __init__ (self, rate = 0):
+        '''!
+        @brief          Creates a simulated counter
+        @param rate     Rate at which the count changes [ticks/s]
+        '''
+        self.rate = rate
+        self.offset = 0
+        self.start = utime.ticks_us()
+
+    def counter (self, value = None):
+        '''!
+        @brief          Reads or sets the count, like @c pyb.Timer.counter()
+        @param value    The new count, or @c None to read the count
+        @return         The count if it is being read
+        '''
+        elapsed = utime.ticks_diff(utime.ticks_us(), self.start)
+        count = self.offset + (self.rate * elapsed) // 1000000
+        if value is None:
+            return count & 0xFFFF
+        self.offset += value - count
+
+    def set_rate (self, rate):
+        '''!
+        @brief          Changes the rate at which the count changes
+        @param rate     The new rate [ticks/s]
+        '''
+        self.offset = self.counter()
+        self.start = utime.ticks_us()
+        self.rate = rate
+
+
+if __name__ == "__main__":
+
+    # Sample a simulated encoder at 2 kHz using a simulated timer which is
+    # polled while the program sleeps, as a task would every 10 ms
+    import cotask
+
+    counter = SimCounter(rate = 5000)
+    sampler = EncoderSampler(counter, cotask.SimTimer(500), size = 64)
+    sampler.start()
+
+    for n in range(10):
+        cotask.SimTimer.sleep_us(10000)
+        print(sampler.num_in(), "samples, newest", sampler.last())
+        sampler.clear()
+    sampler.stop()
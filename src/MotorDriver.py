@@ -43,38 +43,70 @@ class MotorDriver:
         self.ch1 = tim.channel (1, pyb.Timer.PWM, pin=pin1)
         self.ch2 = tim.channel (2, pyb.Timer.PWM, pin=pin2)
         
+        # number of timer counts in one PWM period, which is 100% duty cycle
+        self.max_counts = tim.period() + 1
+        
+        # signed compare count last written; positive counts are on channel 1
+        # and negative counts on channel 2. Both channels start at zero
+        self.ch1.pulse_width(0)
+        self.ch2.pulse_width(0)
+        self.last_counts = 0
+        
 
     def set_duty_cycle (self, duty):
         '''!
         @brief This method sets the duty cycle to be sent to the motor to the given level. Positive values
         cause torque in one direction, negative values in the opposite direction.
-        @param duty A signed integer representing desired duty cycle for the power sent to the motor 
+        @details The duty cycle is converted to timer counts, so a float such as 12.5 gives finer than
+        1% resolution. An integer duty cycle is converted without allocating memory.
+        @param duty A signed number representing desired duty cycle [%] for the power sent to the motor 
+        '''
+        # Truncate toward zero, as ClosedLoop.update_ticks() does, so that the
+        # counts are the same size in both directions
+        counts = int(duty * self.max_counts)
+        if counts < 0:
+            self.set_duty_counts(-(-counts // 100))
+        else:
+            self.set_duty_counts(counts // 100)
+    
+    def set_duty_counts (self, counts):
+        '''!
+        @brief This method sets the duty cycle as a number of timer counts out of max_counts.
+        @details Nothing is written if the counts haven't changed, and only the active channel is
+        written if the direction hasn't changed, so a steady motor costs no hardware writes.
+        @param counts A signed integer number of timer counts; max_counts is 100% duty cycle
         '''
         
-        # CASE 1 & 2: positive duty cycle
-        if duty > 0:
-            # CASE 1: duty cycle needs to be at MAX = 100%
-            if duty > 100:
-                self.ch1.pulse_width_percent(100)
-            # CASE 2: duty cycle is below MAX = 100%
-            else:
-                self.ch1.pulse_width_percent(duty)  
-            self.ch2.pulse_width_percent(0)
-        
-        # CASE 3 & 4: negative duty cycle
-        elif duty < 0:
-            # CASE 3: duty cycle needs to be at MAX = 100%
-            if duty < -100:
-                self.ch2.pulse_width_percent(100)
-            # CASE 4: duty cycle is below MAX = 100%
-            else:
-                self.ch2.pulse_width_percent(-duty)
-            self.ch1.pulse_width_percent(0)
-        
-        # CASE 5: duty cycle is zero
+        # Saturate at 100% duty cycle in either direction
+        if counts > self.max_counts:
+            counts = self.max_counts
+        elif counts < -self.max_counts:
+            counts = -self.max_counts
+        
+        # Skip the write when the duty cycle hasn't changed
+        last = self.last_counts
+        if counts == last:
+            return
+        
+        # CASE 1: positive duty cycle on channel 1
+        if counts > 0:
+            self.ch1.pulse_width(counts)
+            if last < 0:
+                self.ch2.pulse_width(0)
+        
+        # CASE 2: negative duty cycle on channel 2
+        elif counts < 0:
+            self.ch2.pulse_width(-counts)
+            if last > 0:
+                self.ch1.pulse_width(0)
+        
+        # CASE 3: duty cycle is zero, so only the active channel is turned off
+        elif last > 0:
+            self.ch1.pulse_width(0)
         else:
-            self.ch1.pulse_width_percent(0)
-            self.ch2.pulse_width_percent(0)
+            self.ch2.pulse_width(0)
+        
+        self.last_counts = counts
 
         
     def enable(self):
@@ -9,6 +9,7 @@
 '''
 
 import ClosedLoop
+import EncoderDriver
 import utime
 
 class TaskController:
@@ -19,18 +20,26 @@ class TaskController:
     
     stepResponseTimeLimit = 2000
     
-    def __init__(self, share_setpoint, share_duty, share_pos, share_Stop, share_StartTime, queue_pos, queue_encTimes):
+    def __init__(self, share_setpoint, share_duty, share_pos, share_Stop, share_StartTime, queue_log):
         self.share_setpoint = share_setpoint
         self.share_duty = share_duty
         self.share_pos = share_pos
         self.share_Stop = share_Stop
         self.share_StartTime = share_StartTime
-        self.queue_pos = queue_pos
-        self.queue_encTimes = queue_encTimes
+        # RecordQueue of (time [ms], position [ticks]) samples for the step response
+        self.queue_log = queue_log
         
         self.state = self.S0_INIT
+        # Sequence number of the last position used to compute a duty cycle.
+        # The position share belongs to the encoder task, which zeroes it
+        # when share_Stop is set, so this task only reads it
+        self.pos_seq = -1
+        self.pos = share_pos.new_buffer()
 
+        # The controller works in encoder ticks; positions are converted to
+        # radians only when the step response is printed
         self.Control = ClosedLoop.ClosedLoop(50, self.share_setpoint.get())
+        self.Control.set_tick_scale(EncoderDriver.RAD_PER_TICK)
         
     def task(self):
         
@@ -38,7 +47,6 @@ class TaskController:
             if self.state == self.S0_INIT:
                 self.Control.change_setpoint(self.share_setpoint.get())
                 print("StartTime is set")
-                self.share_pos.put(0)
                 self.share_StartTime.put(utime.ticks_ms())
                 self.state = self.S1_RUNNING
                 
@@ -48,21 +56,28 @@ class TaskController:
                     print(time)
                     self.share_Stop.put(1)
                     self.share_duty.put(0)
-                    self.share_pos.put(0)
                     print("\nMotor Data:")
-                    while not self.queue_pos.empty():
-                        print(self.queue_encTimes.get(), self.queue_pos.get())
+                    while self.queue_log.any():
+                        log_time, log_pos = self.queue_log.get()
+                        print(log_time, EncoderDriver.to_rad(log_pos))
                     self.state = self.S2_STOPPED
                 
                 else:
-                    # Update control signal and duty cycle
-                    self.share_duty.put(int(self.Control.update(self.share_pos.get())))
+                    # Update control signal and duty cycle if there's a new
+                    # position. The duty cycle keeps the timestamp of the
+                    # position it was computed from so the motor task can
+                    # measure latency. Sequence numbers are compared rather
+                    # than positions so that nothing is allocated
+                    seq = self.share_pos.get_if_changed(self.pos_seq, self.pos)
+                    if seq != self.pos_seq:
+                        self.pos_seq = seq
+                        self.share_duty.put(self.Control.update_ticks(self.pos[0]),
+                                            stamp = self.share_pos.stamp())
                     time = utime.ticks_diff(utime.ticks_ms(), self.share_StartTime.get())
                     
-                    # Save time and position data
-                    if not self.queue_pos.full():
-                        self.queue_encTimes.put(time)
-                        self.queue_pos.put(self.share_pos.get())
+                    # Save time and position data; samples which don't fit
+                    # are counted as dropped in the queue's statistics
+                    self.queue_log.try_put(time, self.pos[0])
                     
 
             elif self.state == self.S2_STOPPED:
@@ -9,13 +9,16 @@
 '''
 
 import EncoderDriver
+import EncoderSampler
 import pyb
 
 class TaskEncoder:
     
-    def __init__(self, enc_ID, share_pos, share_Stop):
+    def __init__(self, enc_ID, share_pos, share_Stop, share_vel = None, sample_timer = None):
         self.share_Stop = share_Stop
         self.share_pos = share_pos
+        # Optional integer share for the velocity estimate [ticks/s]
+        self.share_vel = share_vel
         self.enc_ID = enc_ID
         if enc_ID == 1:
             # Slo_Enco
@@ -25,15 +28,30 @@ class TaskEncoder:
             self.Enco = EncoderDriver.EncoderDriver(pyb.Pin(pyb.Pin.cpu.C6), pyb.Pin(pyb.Pin.cpu.C7), 8)
         
         self.Enco.zero()
+        
+        # If a timer is given, the counter is sampled in its interrupt and
+        # the samples are fed to the encoder driver in batches by the task
+        self.sampler = None
+        if sample_timer:
+            self.sampler = EncoderSampler.EncoderSampler(self.Enco.timer, sample_timer)
+            self.sampler.start()
     
     def task(self):
         while True: 
             if self.share_Stop.get():
                 self.Enco.zero()
+                if self.sampler:
+                    self.sampler.clear()
                 print("Zeroing Encoder" + str(self.enc_ID))
                 self.share_Stop.put(0)
             
-            self.Enco.update()
-            self.share_pos.put(self.Enco.read())
+            # Position is shared in integer ticks so no memory is allocated
+            if self.sampler:
+                self.sampler.drain(self.Enco)
+            else:
+                self.Enco.update()
+            self.share_pos.put(self.Enco.read_ticks())
+            if self.share_vel:
+                self.share_vel.put(self.Enco.velocity())
             yield (0)
         
@@ -0,0 +1,99 @@
+'''@file                TaskEncoderBank.py
+   @brief               Updates all the encoders in one task.
+   @details             Each run reads every encoder and puts all the
+                        positions into one ArrayShare with one call, each
+                        stamped with the time it was measured, so the
+                        scheduler overhead and the skew between the axes
+                        stay the same however many motors there are.
+
+   @author              Philip Pang
+   @author              Tim Jain
+   @author              Jonathan Cederquist
+   @date                February 17, 2022
+'''
+
+import array
+import utime
+import EncoderDriver
+import EncoderSampler
+import pyb
+
+## Channel A pin, channel B pin and timer number of each encoder by ID
+ENCODER_PINS = {1: (pyb.Pin.cpu.B6, pyb.Pin.cpu.B7, 4),     # Slo_Enco
+                2: (pyb.Pin.cpu.C6, pyb.Pin.cpu.C7, 8)}     # Bro_Enco
+
+class TaskEncoderBank:
+
+    def __init__(self, enc_IDs, share_pos, share_Stops, share_vel = None, sample_timers = None):
+        '''! @brief  Creates the encoder drivers and the buffers for the task.
+             @param  enc_IDs A list of encoder IDs, such as [1, 2]
+             @param  share_pos An ArrayShare of type 'i' with one position
+                     [ticks] for each encoder
+             @param  share_Stops A list of shares, one for each encoder, which
+                     are set to zero that encoder
+             @param  share_vel An optional ArrayShare of type 'i' for the
+                     velocity [ticks/s] of each encoder
+             @param  sample_timers An optional list with a timer for each
+                     encoder, or None for an encoder which is read by the task.
+                     An encoder with a timer is sampled in that timer's
+                     interrupt by an EncoderSampler, and the task feeds the
+                     samples to its driver in a batch
+        '''
+        self.enc_IDs = enc_IDs
+        self.share_pos = share_pos
+        self.share_Stops = share_Stops
+        self.share_vel = share_vel
+        self.num = len(enc_IDs)
+
+        self.Encos = []
+        self.samplers = []
+        for idx in range(self.num):
+            pin_A, pin_B, timer = ENCODER_PINS[enc_IDs[idx]]
+            Enco = EncoderDriver.EncoderDriver(pyb.Pin(pin_A), pyb.Pin(pin_B), timer)
+            Enco.zero()
+            self.Encos.append(Enco)
+            
+            sampler = None
+            if sample_timers and sample_timers[idx]:
+                sampler = EncoderSampler.EncoderSampler(Enco.timer, sample_timers[idx])
+                sampler.start()
+            self.samplers.append(sampler)
+
+        # Positions and velocities are gathered here, then put all at once,
+        # along with the time at which each position was measured
+        self.positions = array.array('i', [0] * self.num)
+        self.velocities = array.array('i', [0] * self.num)
+        self.stamps = array.array('l', [utime.ticks_us()] * self.num)
+
+    def task(self):
+        while True:
+            # Encoders read by the task all get the same timestamp, while those
+            # which are sampled get the time of their newest sample
+            now = utime.ticks_us()
+            idx = 0
+            while idx < self.num:
+                Enco = self.Encos[idx]
+                sampler = self.samplers[idx]
+                if self.share_Stops[idx].get():
+                    Enco.zero()
+                    if sampler:
+                        sampler.clear()
+                    print("Zeroing Encoder" + str(self.enc_IDs[idx]))
+                    self.share_Stops[idx].put(0)
+                    self.stamps[idx] = now
+
+                if sampler:
+                    if sampler.drain(Enco):
+                        self.stamps[idx] = Enco.last_time
+                else:
+                    Enco.update(now)
+                    self.stamps[idx] = now
+                self.positions[idx] = Enco.read_ticks()
+                if self.share_vel:
+                    self.velocities[idx] = Enco.velocity()
+                idx += 1
+
+            self.share_pos.put_all(self.positions, stamps = self.stamps)
+            if self.share_vel:
+                self.share_vel.put_all(self.velocities, stamps = self.stamps)
+            yield (0)
@@ -12,8 +12,12 @@ import MotorDriver
 import pyb
 
 class TaskMotor:
-    def __init__ (self, motor_ID, share_duty):
+    def __init__ (self, motor_ID, share_duty, latency = None):
         self.share_duty = share_duty
+        # Buffer into which each new duty cycle is read
+        self.duty = share_duty.new_buffer()
+        # Optional cotask.LatencyProbe recording the age of each duty applied
+        self.latency = latency
         if motor_ID == 1:
             # Slo_Moe
             self.Moe = MotorDriver.MotorDriver(pyb.Pin.board.PA10, pyb.Pin.board.PB4, pyb.Pin.board.PB5, 3)
@@ -24,7 +28,14 @@ class TaskMotor:
         
     def task(self):
         self.Moe.enable()
+        duty_seq = -1
         while True:
-            self.Moe.set_duty_cycle(self.share_duty.get())   
+            # Only write to the motor driver when there's a new duty cycle
+            seq = self.share_duty.get_if_changed(duty_seq, self.duty)
+            if seq != duty_seq:
+                duty_seq = seq
+                self.Moe.set_duty_cycle(self.duty[0])
+                if self.latency:
+                    self.latency.record(self.share_duty.age())
             yield (0)
         
@@ -0,0 +1,102 @@
+'''@file                TaskRecorder.py
+   @brief               Flight recorder which keeps a history of all shares.
+   @details             At each run the value of every numeric share is
+                        copied into a preallocated circular buffer along with
+                        the time, so the last few seconds before something
+                        goes wrong can be dumped and examined afterwards.
+                        Nothing is allocated while the task runs, so turning
+                        the recorder on doesn't change the timing of the
+                        other tasks.
+
+   @author              Philip Pang
+   @author              Tim Jain
+   @author              Jonathan Cederquist
+   @date                February 17, 2022
+'''
+
+import array
+import struct
+import utime
+import task_share
+
+class TaskRecorder:
+    '''! @brief  Records snapshots of all numeric shares in a ring buffer.
+         @details The recorder should be created after all the shares it is
+                  to record, since the number of values in each frame is fixed
+                  when the buffer is allocated; shares made later are left
+                  out of the snapshots. Integer shares are kept in
+                  32-bit integers and float shares in 32-bit floats, so that
+                  large integers such as times and positions stay exact.
+                  Unsigned 32-bit shares are stored as signed numbers.
+    '''
+
+    ## Marker at the start of a binary dump
+    MAGIC = b'FREC'
+
+    def __init__(self, frames = 200):
+        '''! @brief  Allocates the buffers for the recorder.
+             @param  frames Number of snapshots kept; older ones are overwritten
+        '''
+        self.frames = frames
+        self.int_width = len(task_share.int_list)
+        self.float_width = len(task_share.float_list)
+        self.names = task_share.numeric_names(task_share.int_list) \
+            + task_share.numeric_names(task_share.float_list)
+        # Time of each frame [us] and the integer and float share values,
+        # one row per frame. Type code 'i' is 32 bits on the board and on a PC
+        self.times = array.array('i', [0] * frames)
+        self.int_values = array.array('i', [0] * (frames * self.int_width))
+        self.float_values = array.array('f', [0] * (frames * self.float_width))
+        # Index of the next frame to be written and number of valid frames
+        self.idx = 0
+        self.num = 0
+
+    def record(self):
+        '''! @brief  Saves one snapshot of the shares, overwriting the oldest.
+        '''
+        task_share.snapshot_all(self.float_values, self.idx * self.float_width,
+                                int_buffer = self.int_values,
+                                int_offset = self.idx * self.int_width,
+                                num = self.float_width,
+                                int_num = self.int_width)
+        self.times[self.idx] = utime.ticks_us()
+        self.idx += 1
+        if self.idx >= self.frames:
+            self.idx = 0
+        if self.num < self.frames:
+            self.num += 1
+
+    def clear(self):
+        '''! @brief  Discards all the recorded frames.
+        '''
+        self.idx = 0
+        self.num = 0
+
+    def dump(self, stream):
+        '''! @brief  Writes the recorded frames to a stream in binary.
+             @details The dump begins with @c MAGIC, then the numbers of
+                      integer and float values per frame and the number of
+                      frames as little-endian 16-bit integers, then the share
+                      names, integer shares first, separated by commas and
+                      ending in a newline. This is followed by the frame times
+                      as 32-bit integers [us], then the integer values of the
+                      frames as 32-bit integers and then their float values as
+                      32-bit floats, each from oldest to newest.
+             @param  stream A file or other object with a @c write() method
+        '''
+        stream.write(self.MAGIC)
+        stream.write(struct.pack('<HHH', self.int_width, self.float_width, self.num))
+        stream.write((','.join(self.names) + '\n').encode())
+
+        # The oldest frame is at the write index once the buffer has wrapped
+        first = self.idx if self.num == self.frames else 0
+        for data, width in ((self.times, 1), (self.int_values, self.int_width),
+                            (self.float_values, self.float_width)):
+            view = memoryview(data)
+            stream.write(view[first * width:self.num * width])
+            stream.write(view[0:first * width])
+
+    def task(self):
+        while True:
+            self.record()
+            yield (0)
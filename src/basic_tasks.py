@@ -11,6 +11,7 @@
 """
 
 import gc
+import sys
 import pyb
 import cotask
 import task_share
@@ -55,10 +56,10 @@ if __name__ == "__main__":
     q0 = task_share.Queue ('L', 16, thread_protect = False, overwrite = False,
                            name = "Queue 0")
 
-    # Create the tasks. If trace is enabled for any task, memory will be
-    # allocated for state transition tracing, and the application will run out
-    # of memory after a while and quit. Therefore, use tracing only for 
-    # debugging and set trace to False when it's not needed
+    # Create the tasks. If trace is enabled for any task, a buffer holding the
+    # most recent state transitions is allocated when the task is created.
+    # Tracing slows things down a little, so set trace to False when it's
+    # not needed
     task1 = cotask.Task (task1_fun, name = 'Task_1', priority = 1, 
                          period = 400, profile = True, trace = False)
     task2 = cotask.Task (task2_fun, name = 'Task_2', priority = 2, 
@@ -73,8 +74,7 @@ if __name__ == "__main__":
     # Run the scheduler with the chosen scheduling algorithm. Quit if any 
     # character is received through the serial port
     vcp = pyb.USB_VCP ()
-    while not vcp.any ():
-        cotask.task_list.pri_sched ()
+    cotask.task_list.run (stop = vcp.any)
 
     # Empty the comm port buffer of the character(s) just pressed
     vcp.read ()
@@ -82,5 +82,5 @@ if __name__ == "__main__":
     # Print a table of task data and a table of shared information data
     print ('\n' + str (cotask.task_list))
     print (task_share.show_all ())
-    print (task1.get_trace ())
+    task1.get_trace (sys.stdout)
     print ('\r\n')
\ No newline at end of file
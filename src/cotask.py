@@ -16,10 +16,77 @@ chosen scheduling algorithm such as round-robin or highest-priority-first.
            under the GNU Public License, version 3.0. 
 """
 
-import gc                              # Memory allocation garbage collector
+import array                           # Compact arrays for trace data
 import utime                           # Micropython version of time library
 import micropython                     # This shuts up incorrect warnings
 
+# On a board, the CPU is put to sleep until an interrupt while no task is
+# ready; on a PC there is no pyb module and the scheduler sleeps instead
+try:
+    import pyb
+except ImportError:
+    pyb = None
+
+
+def wait_for_interrupt (time_us):
+    """!
+    Stop the CPU until the next interrupt. This is the idle function used by
+    @c TaskList.run() on a board. Unlike @c utime.sleep_us(), which spins
+    until the time is up, it really idles the CPU, and an interrupt which
+    calls a task's @c go() method ends the wait at once. The SysTick
+    interrupt occurs every millisecond, so the wait is never longer than
+    that.
+    @param time_us The longest time to wait; it isn't needed, since the CPU
+           wakes up at the next interrupt anyway
+    """
+    pyb.wfi ()
+
+
+## The number of bins in a timing histogram. Bin 0 counts times of zero; bin
+#  @c n counts times from 2<sup>n-1</sup> to 2<sup>n</sup> - 1 microseconds,
+#  and the last bin also counts all longer times.
+HIST_BINS = 24
+
+
+@micropython.native
+def hist_add (hist, time_us):
+    """!
+    Count a time in a log-scaled histogram. This function doesn't allocate
+    memory, so it can be used in the scheduler's time-critical code.
+    @param hist An array of @c HIST_BINS counts
+    @param time_us The time to be counted, in microseconds
+    """
+    idx = 0
+    while time_us > 0 and idx < HIST_BINS - 1:
+        time_us >>= 1
+        idx += 1
+    hist[idx] += 1
+
+
+def hist_percentile (hist, percent):
+    """!
+    Find a percentile of the times counted in a log-scaled histogram. Since
+    each bin covers a range of times, the result is the upper end of the
+    range of the bin in which the percentile falls.
+    @param hist An array of @c HIST_BINS counts
+    @param percent The percentile to be found, from 0 to 100
+    @return The time in microseconds below which about @c percent percent of
+            the counted times fall, or @c None if nothing has been counted
+    """
+    total = 0
+    for count in hist:
+        total += count
+    if total == 0:
+        return None
+
+    target = total * percent / 100.0
+    total = 0
+    for idx in range (HIST_BINS):
+        total += hist[idx]
+        if total >= target:
+            break
+    return (1 << idx) - 1
+
 
 class Task:
     """!
@@ -56,9 +123,27 @@ class Task:
       @endcode
       """
 
+    ## Flag which is set whenever any task's @c go() method is called. The
+    #  idle loop in @c TaskList.run() watches it so that it can stop sleeping
+    #  as soon as a task has been made ready by an interrupt.
+    wakeup = False
+
+    ## Overrun policy: when a task is released late by a period or more, run
+    #  it once for each release it missed, back to back, until it catches up
+    OVERRUN_BURST = 0
+
+    ## Overrun policy: when a task is released late by a period or more, skip
+    #  the releases it missed and keep its original timing phase
+    OVERRUN_SKIP = 1
+
+    ## Overrun policy: when a task is released late by a period or more, run
+    #  it once and schedule the next run a full period from now
+    OVERRUN_REALIGN = 2
+
 
     def __init__ (self, run_fun, name = "NoName", priority = 0, 
-                  period = None, profile = False, trace = False):
+                  period = None, profile = False, trace = False,
+                  trace_len = 100, overrun = OVERRUN_BURST):
         """!
         Initialize a task object so it may be run by the scheduler.
 
@@ -76,8 +161,17 @@ class Task:
                The time can be given in a @c float or @c int; it will be 
                converted to microseconds for internal use by the scheduler.
         @param profile Set to @c True to enable run-time profiling 
-        @param trace Set to @c True to generate a list of transitions between
-               states. @b Note: This slows things down and allocates memory.
+        @param trace Set to @c True to record transitions between states.
+               The most recent @c trace_len transitions are kept in buffers
+               which are allocated here, so tracing can be left on for as
+               long as the program runs. It does slow things down a bit.
+               States are stored as 16-bit integers, so a state which isn't
+               an integer from -32768 to 32767, such as @c None or a string,
+               is recorded in the trace as -1.
+        @param trace_len The number of transitions kept in the trace buffer
+        @param overrun What to do when the task is released a period or more
+               late: @c OVERRUN_BURST (the default), @c OVERRUN_SKIP or
+               @c OVERRUN_REALIGN
         """
         # The function which is run to implement this task's code. Since it 
         # is a generator, we "run" it here, which doesn't actually run it but
@@ -103,110 +197,213 @@ class Task:
             self.period = period
             self._next_run = None
 
+        # The policy used when the task falls behind by a period or more
+        self._overrun = overrun
+
         # Flag which causes the task to be profiled, in which the execution
         #  time of the @c run() method is measured and basic statistics kept. 
+        #  Histograms of run times and lateness are kept in arrays which are
+        #  allocated here so that profiling doesn't allocate memory later
         self._prof = profile
+        if profile:
+            self._run_hist = array.array ('L', range (HIST_BINS))
+            self._late_hist = array.array ('L', range (HIST_BINS))
         self.reset_profile ()
 
         # The previous state in which the task last ran. It is used to watch
         # for and track state transitions.
         self._prev_state = 0
 
-        # If transition tracing has been enabled, create an empty list in 
-        # which to store transition (time, to-state) stamps
+        # If transition tracing has been enabled, create a ring buffer in
+        # which to store transition (time, to-state) stamps. Times are stored
+        # as microseconds since the previous transition. When the buffer is
+        # full the oldest entry is overwritten, and the state it went to is
+        # saved as the state from which the oldest remaining entry starts
         self._trace = trace
-        self._tr_data = []
+        if trace:
+            self._tr_len = int (trace_len)
+            self._tr_times = array.array ('l', range (self._tr_len))
+            self._tr_states = array.array ('h', range (self._tr_len))
+        self._tr_idx = 0
+        self._tr_num = 0
+        self._tr_first = 0
         self._prev_time = utime.ticks_us ()
 
         ## Flag which is set true when the task is ready to be run by the
         #  scheduler
         self.go_flag = False
 
+        # The number of times the task has been released but not yet run. A
+        # scheduler which releases a late task again before it has run, as
+        # @c deadline_sched() can, then still runs it once for each release
+        self._pending = 0
+
+        # The task list holding this task, if that list keeps a mask of ready
+        # priority levels, and the bit which stands for this task's level in
+        # the mask. They are set by the task list
+        self._list = None
+        self._ready_bit = 0
 
-    def schedule (self) -> bool:
+
+    def schedule (self, now = None) -> bool:
         """!
         This method is called by the scheduler; it attempts to run this task.
         If the task is not yet ready to run, this method returns @c False
         immediately; if this task is ready to run, it runs the task's generator
         up to the next @c yield() and then returns @c True.
 
+        @param now The time from @c utime.ticks_us() at which the scheduler
+               began its pass, or @c None to read the clock here
         @return @c True if the task ran or @c False if it did not
         """
-        if self.ready ():
-
-            # Reset the go flag for the next run
-            self.go_flag = False
-
-            # If profiling, save the start time
-            if self._prof:
-                stime = utime.ticks_us ()
-
-            # Run the method belonging to the state which should be run next
-            curr_state = next (self._run_gen)
-
-            # If profiling or tracing, save timing data
-            if self._prof or self._trace:
-                etime = utime.ticks_us ()
-
-            # If profiling, save timing data
-            if self._prof:
-                self._runs += 1
-                runt = utime.ticks_diff (etime, stime)
-                if self._runs > 2:
-                    self._run_sum += runt
-                    if runt > self._slowest:
-                        self._slowest = runt
-
-            # If transition logic tracing is on, record a transition; if not,
-            # ignore the state. If out of memory, switch tracing off and 
-            # run the memory allocation garbage collector
-            if self._trace:
-                try:
-                    if curr_state != self._prev_state:
-                        self._tr_data.append (
-                            (utime.ticks_diff (etime, self._prev_time),
-                             curr_state))
-                except MemoryError:
-                    self._trace = False
-                    gc.collect ()
-
-                self._prev_state = curr_state
-                self._prev_time = etime
+        if now is None:
+            now = utime.ticks_us ()
 
+        if self.ready (now):
+            self.run (now)
             return True
 
         else:
             return False
 
 
+    def run (self, stime = None):
+        """!
+        This method runs the task's generator up to the next @c yield()
+        without checking whether the task is ready. It is used by
+        @c schedule() and by schedulers which have already decided by some
+        other means that this task should run. Profiling and tracing data are
+        saved as the task runs.
+        @param stime The time from @c utime.ticks_us() at which the run is
+               considered to start, or @c None to read the clock here
+        """
+        # Reset the go flag for the next run, unless the task has been
+        # released more times than it has run and must run again
+        if self._pending > 1:
+            self._pending -= 1
+            if self._list is not None:
+                self._mark_ready ()
+        else:
+            self._pending = 0
+            self.go_flag = False
+
+        # If profiling, save the start time unless the scheduler gave us one
+        if self._prof and stime is None:
+            stime = utime.ticks_us ()
+
+        # Run the method belonging to the state which should be run next
+        curr_state = next (self._run_gen)
+
+        # If profiling or tracing, save timing data
+        if self._prof or self._trace:
+            etime = utime.ticks_us ()
+
+        # If profiling, save timing data
+        if self._prof:
+            self._runs += 1
+            runt = utime.ticks_diff (etime, stime)
+            if self._runs > 2:
+                self._run_sum += runt
+                if runt > self._slowest:
+                    self._slowest = runt
+                hist_add (self._run_hist, runt)
+
+        # If transition logic tracing is on, record a transition in the ring
+        # buffer, overwriting the oldest one if the buffer is full
+        if self._trace:
+            if curr_state != self._prev_state:
+                # Only 16-bit integer states fit in the trace buffer
+                if isinstance (curr_state, int) \
+                        and -32768 <= curr_state <= 32767:
+                    tr_state = curr_state
+                else:
+                    tr_state = -1
+                idx = self._tr_idx
+                if self._tr_num >= self._tr_len:
+                    self._tr_first = self._tr_states[idx]
+                else:
+                    self._tr_num += 1
+                self._tr_times[idx] = utime.ticks_diff (etime, self._prev_time)
+                self._tr_states[idx] = tr_state
+                idx += 1
+                if idx >= self._tr_len:
+                    idx = 0
+                self._tr_idx = idx
+                self._prev_time = etime
+
+            self._prev_state = curr_state
+
+
     @micropython.native
-    def ready (self) -> bool:
+    def ready (self, now = None) -> bool:
         """!
         This method checks if the task is ready to run.
         If the task runs on a timer, this method checks what time it is; if not,
         this method checks the flag which indicates that the task is ready to
         go. This method may be overridden in descendent classes to implement
         some other behavior.
+        @param now The time from @c utime.ticks_us() at which the scheduler
+               began its pass, or @c None to read the clock here
         """
         # If this task uses a timer, check if it's time to run run() again. If
         # so, set go flag and set the timer to go off at the next run time
         if self.period != None:
-            late = utime.ticks_diff (utime.ticks_us (), self._next_run)
+            if now is None:
+                now = utime.ticks_us ()
+            late = utime.ticks_diff (now, self._next_run)
             if late > 0:
-                self.go_flag = True
-                self._next_run = utime.ticks_diff (self.period, 
-                                                   -self._next_run)
-
-                # If keeping a latency profile, record the data
-                if self._prof:
-                    self._late_sum += late
-                    if late > self._latest:
-                        self._latest = late
+                self.release (late)
 
         # If the task doesn't use a timer, we rely on go_flag to signal ready
         return self.go_flag
 
 
+    @micropython.native
+    def release (self, late):
+        """!
+        This method releases a timed task whose run time has arrived. It sets
+        the go flag, moves the next run time one period later, and records
+        latency data if the task is being profiled. It is called by 
+        @c ready() and by schedulers which keep track of run times themselves.
+
+        If the task is late by a period or more, releases have been missed
+        and the task's overrun policy decides what happens. With 
+        @c OVERRUN_BURST the next run time still moves one period, so the
+        task runs back to back until it catches up; each such late release
+        counts as one miss and gives one run, even if the task is released
+        again before it has run. With @c OVERRUN_SKIP the next run time skips
+        ahead past the missed releases, and with @c OVERRUN_REALIGN it is
+        set to one period after the current time; either way the releases
+        which were skipped are counted as misses.
+        @param late The time in microseconds by which the run time has passed
+        """
+        self.go_flag = True
+        self._pending += 1
+        if self._list is not None:
+            self._mark_ready ()
+        if late < self.period:
+            self._next_run = utime.ticks_add (self._next_run, self.period)
+        elif self._overrun == Task.OVERRUN_SKIP:
+            missed = late // self.period
+            self._missed += missed
+            self._next_run = utime.ticks_add (self._next_run,
+                                              (missed + 1) * self.period)
+        elif self._overrun == Task.OVERRUN_REALIGN:
+            self._missed += late // self.period
+            self._next_run = utime.ticks_add (self._next_run,
+                                              late + self.period)
+        else:
+            self._missed += 1
+            self._next_run = utime.ticks_add (self._next_run, self.period)
+
+        # If keeping a latency profile, record the data
+        if self._prof:
+            self._late_sum += late
+            if late > self._latest:
+                self._latest = late
+            hist_add (self._late_hist, late)
+
+
     def set_period (self, new_period):
         """!
         This method sets the period between runs of the task to the given
@@ -230,28 +427,55 @@ class Task:
         self._slowest = 0
         self._late_sum = 0
         self._latest = 0
+        self._missed = 0
+        if self._prof:
+            for idx in range (HIST_BINS):
+                self._run_hist[idx] = 0
+                self._late_hist[idx] = 0
 
 
-    def get_trace (self):
+    def get_trace (self, stream = None):
         """!
-        This method returns a string containing the task's transition trace.
-        The trace is a set of tuples, each of which contains a time and the
-        states from and to which the system transitioned. 
-        @return A possibly quite large string showing state transitions
+        This method shows the task's transition trace. Each line of the trace
+        shows a time and the states from and to which the task transitioned.
+        If the trace buffer has filled up, only the most recent transitions
+        are shown, with times measured from just before the oldest of them.
+        If a stream such as @c sys.stdout is given, the trace is written to
+        it one line at a time so that no large string needs to be built.
+        @param stream An object with a @c write() method to which the trace is
+               written, or @c None to return the trace as a string
+        @return A possibly quite large string showing state transitions, or
+                @c None if the trace was written to @c stream
         """
-        tr_str = 'Task ' + self.name + ':'
-        if self._trace:
-            tr_str += '\n'
-            last_state = 0
-            total_time = 0.0
-            for item in self._tr_data:
-                total_time += item[0] / 1000000.0
-                tr_str += '{: 12.6f}: {: 2d} -> {:d}\n'.format (total_time, 
-                    last_state, item[1])
-                last_state = item[1]
-        else:
-            tr_str += ' not traced'
-        return (tr_str)
+        if stream is None:
+            return ''.join (self._trace_lines ())
+        for line in self._trace_lines ():
+            stream.write (line)
+
+
+    def _trace_lines (self):
+        """!
+        This generator produces the lines of text shown by @c get_trace(),
+        oldest transition first.
+        """
+        if not self._trace:
+            yield 'Task ' + self.name + ': not traced'
+            return
+
+        yield 'Task ' + self.name + ':\n'
+        idx = self._tr_idx - self._tr_num
+        if idx < 0:
+            idx += self._tr_len
+        last_state = self._tr_first
+        total_time = 0.0
+        for count in range (self._tr_num):
+            total_time += self._tr_times[idx] / 1000000.0
+            yield '{: 12.6f}: {: 2d} -> {:d}\n'.format (total_time, 
+                last_state, self._tr_states[idx])
+            last_state = self._tr_states[idx]
+            idx += 1
+            if idx >= self._tr_len:
+                idx = 0
 
 
     def go (self):
@@ -261,6 +485,29 @@ class Task:
         another task which has data that this task needs to process soon.
         """
         self.go_flag = True
+        if self._list is not None:
+            self._mark_ready ()
+        Task.wakeup = True
+
+
+    @micropython.native
+    def _mark_ready (self):
+        """!
+        Set the bit for this task's priority level in its task list's mask of
+        ready levels, so that @c TaskList.flag_sched() looks at that level.
+        Interrupts are disabled while the mask is changed so that a bit set by
+        an interrupt at the same time isn't lost. This doesn't allocate 
+        memory, so it may be called from an interrupt service routine. It is
+        only called when the task is in a list which keeps the mask, which
+        the caller checks so that other schedulers don't pay for it.
+        """
+        task_list = self._list
+        if pyb:
+            irq_state = pyb.disable_irq ()
+            task_list._ready |= self._ready_bit
+            pyb.enable_irq (irq_state)
+        else:
+            task_list._ready |= self._ready_bit
 
 
     def __repr__ (self):
@@ -277,13 +524,149 @@ class Task:
         rst += '{: 8d}'.format (self._runs)
 
         if self._prof and self._runs > 0:
-            avg_dur = (self._run_sum / self._runs) / 1000.0
+            avg_dur = (self._run_sum / max (self._runs - 2, 1)) / 1000.0
             avg_late = (self._late_sum / self._runs) / 1000.0
             rst += '{: 10.3f}{: 10.3f}'.format (avg_dur, 
                 self._slowest / 1000.0)
             if self.period != None:
-                rst += '{: 10.3f}{: 10.3f}'.format (avg_late, 
-                                            self._latest / 1000.0)
+                rst += '{: 10.3f}{: 10.3f}{: 8d}'.format (avg_late, 
+                                            self._latest / 1000.0,
+                                            self._missed)
+        return rst
+
+
+    def percentiles (self):
+        """!
+        Make a line of text showing percentiles of the task's run times and
+        lateness, as found from the profiling histograms. All times are shown
+        in milliseconds; the percentiles are upper bounds accurate to within
+        a factor of two (but never more than the maximum), while the maximum
+        times are exact.
+        @return A string showing the 50th, 90th and 99th percentiles and the
+                maximum of run time and of lateness, or @c None if the task
+                hasn't been profiled
+        """
+        if not self._prof or self._runs <= 2:
+            return None
+
+        rst = '{:<16s}'.format (self.name)
+        for pct in (50, 90, 99):
+            rst += '{: 9.3f}'.format (min (self._slowest,
+                hist_percentile (self._run_hist, pct)) / 1000.0)
+        rst += '{: 9.3f}'.format (self._slowest / 1000.0)
+
+        if self.period != None and self._latest > 0:
+            for pct in (50, 90, 99):
+                rst += '{: 9.3f}'.format (min (self._latest,
+                    hist_percentile (self._late_hist, pct)) / 1000.0)
+            rst += '{: 9.3f}'.format (self._latest / 1000.0)
+        return rst
+
+
+# =============================================================================
+
+class Chain (Task):
+    """!
+    A task which runs a sequence of generators back to back as one task.
+
+    Tasks which form a pipeline, such as reading an encoder, computing a
+    control output and setting a motor's duty cycle, can be chained so that
+    all the stages run in the same scheduling slot. Data produced by one
+    stage is then used by the next stage right away instead of waiting for
+    the next task to be scheduled. Each time the chain is run, each stage's
+    generator is run up to its next @c yield(), in order. The chain yields
+    the state of the last stage. If profiling is enabled, the run time of
+    each stage is measured as well as that of the whole chain.
+
+    Example:
+      @code
+          axis_1 = cotask.Chain ((enco1.task, control1.task, motor1.task),
+                                 name = 'Axis_1', priority = 2, period = 10,
+                                 profile = True,
+                                 stage_names = ('Encoder', 'Control', 
+                                                'Motor'))
+          cotask.task_list.append (axis_1)
+      @endcode
+    """
+
+    def __init__ (self, run_funs, name = "NoName", priority = 0, 
+                  period = None, profile = False, trace = False,
+                  trace_len = 100, overrun = Task.OVERRUN_BURST,
+                  stage_names = None):
+        """!
+        Initialize a chain of generators to be run as one task.
+        @param run_funs A sequence of functions, each of which must be a
+               generator which yields its current state, in the order in
+               which they are to be run
+        @param stage_names A sequence of names for the stages, used in the
+               diagnostic printout, or @c None to name them by number
+        
+        The other parameters are the same as those for @c Task.
+        """
+        self._stages = tuple ([fun () for fun in run_funs])
+        self._num_stages = len (self._stages)
+        if stage_names is None:
+            self._stage_names = tuple (['Stage ' + str (idx) 
+                                        for idx in range (self._num_stages)])
+        else:
+            self._stage_names = tuple (stage_names)
+
+        # Run time totals and maxima for each stage
+        self._stage_sum = [0] * self._num_stages
+        self._stage_max = [0] * self._num_stages
+
+        super ().__init__ (self._run_stages, name, priority, period, profile,
+                           trace, trace_len, overrun)
+
+
+    def _run_stages (self):
+        """!
+        This generator runs each stage of the chain once each time it is run,
+        timing the stages if the chain is being profiled.
+        """
+        while True:
+            idx = 0
+            while idx < self._num_stages:
+                if self._prof:
+                    stime = utime.ticks_us ()
+
+                state = next (self._stages[idx])
+
+                # The first couple of runs aren't counted, as in run()
+                if self._prof and self._runs >= 2:
+                    runt = utime.ticks_diff (utime.ticks_us (), stime)
+                    self._stage_sum[idx] += runt
+                    if runt > self._stage_max[idx]:
+                        self._stage_max[idx] = runt
+                idx += 1
+
+            yield state
+
+
+    def reset_profile (self):
+        """!
+        This method resets the variables used for execution time profiling,
+        including those for each stage of the chain.
+        """
+        super ().reset_profile ()
+        for idx in range (self._num_stages):
+            self._stage_sum[idx] = 0
+            self._stage_max[idx] = 0
+
+
+    def __repr__ (self):
+        """!
+        This method converts the chain to a string for diagnostic use. A line
+        for the chain as a whole is followed by a line for each stage showing
+        its average and maximum run times in milliseconds.
+        """
+        rst = super ().__repr__ ()
+        if self._prof and self._runs > 2:
+            for idx in range (self._num_stages):
+                rst += '\n  {:<14s}{:22s}{: 10.3f}{: 10.3f}'.format (
+                    self._stage_names[idx], '', 
+                    self._stage_sum[idx] / (self._runs - 2) / 1000.0,
+                    self._stage_max[idx] / 1000.0)
         return rst
 
 
@@ -315,6 +698,36 @@ class TaskList:
         #  that priority. 
         self.pri_list = []
 
+        # A binary min-heap holding the tasks which run on a timer, ordered by
+        # the time at which each is next due to run. It is used by the
+        # deadline-ordered scheduler @c deadline_sched()
+        self._heap = []
+
+        # Timers which release timed tasks, if @c start_timers() was called
+        self._timers = []
+
+        # The table of minor frames used by @c cyclic_sched(), the length of
+        # a minor frame in microseconds, the index of the next frame to be
+        # run, and the time at which that frame is due
+        self._slots = None
+        self._minor = 0
+        self._frame_idx = 0
+        self._frame_time = 0
+
+        # Totals of idle time and of all time spent in @c run(), used to
+        # compute the percentage of time the CPU has been idle
+        self._idle_us = 0
+        self._total_us = 0
+
+        # A mask with one bit for each priority level which may have a task
+        # whose go flag is set; bit 0 is the highest priority. The dictionary
+        # finds the index in @c pri_list of the level given its bit. The mask
+        # is only kept once a scheduler which uses it has been started, so
+        # that releasing tasks costs nothing extra under other schedulers
+        self._ready = 0
+        self._bit_level = {}
+        self._masked = False
+
 
     def append (self, task):
         """!
@@ -341,10 +754,94 @@ class TaskList:
 
         # Make sure the main list (of lists at each priority) is sorted
         self.pri_list.sort (key=lambda pri: pri[0], reverse=True)
+        self._index_levels ()
+
+        # Tasks which run on a timer are also kept in order of their due times
+        if task.period != None:
+            self._heap_push (task)
+
+
+    def _index_levels (self):
+        """!
+        Give each task the bit which stands for its priority level in the
+        mask of ready levels, and set the bits of the levels which have tasks
+        that are already ready. This is done whenever the priority lists
+        change. Until the mask has been turned on by @c _use_mask(), the
+        tasks aren't told about the list, so they don't set any bits. With
+        more than 30 priority levels the bits would no longer be small 
+        integers, and setting them from an interrupt would allocate memory.
+        """
+        self._bit_level = {}
+        mask = 0
+        for level in range (len (self.pri_list)):
+            bit = 1 << level
+            self._bit_level[bit] = level
+            for task in self.pri_list[level][2:]:
+                task._list = self if self._masked else None
+                task._ready_bit = bit
+                if task.go_flag:
+                    mask |= bit
+        self._ready = mask
+
+
+    def _use_mask (self):
+        """!
+        Start keeping the mask of ready priority levels. This is done the
+        first time a scheduler which uses the mask is run, or when timers are
+        started to release the tasks. The mask is built from the go flags of
+        the tasks, so tasks made ready before then aren't missed.
+        """
+        self._masked = True
+        self._index_levels ()
+
+
+    @micropython.native
+    def _heap_push (self, task):
+        """!
+        Put a timed task into the heap of due times, moving it up the heap
+        until no task above it is due later than it is. Times are compared
+        with @c ticks_diff() so that timer rollover is handled correctly.
+        @param task The task to be put into the heap
+        """
+        heap = self._heap
+        heap.append (task)
+        idx = len (heap) - 1
+        while idx > 0:
+            parent = (idx - 1) >> 1
+            if utime.ticks_diff (task._next_run, heap[parent]._next_run) >= 0:
+                break
+            heap[idx] = heap[parent]
+            idx = parent
+        heap[idx] = task
 
 
     @micropython.native
-    def rr_sched (self):
+    def _heap_sift_down (self):
+        """!
+        Move the task at the top of the heap of due times down the heap until
+        no task below it is due sooner. This is done after the top task's
+        next run time has been moved later.
+        """
+        heap = self._heap
+        length = len (heap)
+        task = heap[0]
+        idx = 0
+        while True:
+            child = 2 * idx + 1
+            if child >= length:
+                break
+            if child + 1 < length and utime.ticks_diff (
+                    heap[child + 1]._next_run, heap[child]._next_run) < 0:
+                child += 1
+            if utime.ticks_diff (heap[child]._next_run, task._next_run) >= 0:
+                break
+            heap[idx] = heap[child]
+            idx = child
+        heap[idx] = task
+
+
+    @micropython.native
+    def rr_sched (self, now = None):
         """!
         Run tasks in order, ignoring the tasks' priorities.
 
@@ -355,22 +852,45 @@ class TaskList:
         tasks are given a chance to run each time through the list, and it takes
         about the same amount of time before each is given a chance to run 
         again.
+
+        The clock is read once at the start of the pass and that time is used
+        to check whether each task is ready. It is read again only after a
+        task has actually run, so that the next task's run time isn't charged
+        with the time used by the one before it.
+        @param now The time from @c utime.ticks_us() to be used for this pass,
+               or @c None to read the clock here
+        @return @c True if any task ran or @c False if none was ready
         """
+        if now is None:
+            now = utime.ticks_us ()
+
         # For each priority level, run all tasks at that level
+        ran = False
         for pri in self.pri_list:
             for task in pri[2:]:
-                task.schedule ()
+                if task.schedule (now):
+                    ran = True
+                    now = utime.ticks_us ()
+        return ran
 
 
     @micropython.native
-    def pri_sched (self):
+    def pri_sched (self, now = None):
         """!
         Run tasks according to their priorities.
 
         This scheduler runs tasks in a priority based fashion. Each time it is
         called, it finds the highest priority task which is ready to run and
-        calls that task's @c run() method.
+        calls that task's @c run() method. The clock is read only once per
+        pass, so all tasks checked in the pass see the same time and their
+        lateness figures can be compared directly.
+        @param now The time from @c utime.ticks_us() to be used for this pass,
+               or @c None to read the clock here
+        @return @c True if a task ran or @c False if none was ready
         """
+        if now is None:
+            now = utime.ticks_us ()
+
         # Go down the list of priorities, beginning with the highest
         for pri in self.pri_list:
             # Within each priority list, run tasks in round-robin order
@@ -379,13 +899,553 @@ class TaskList:
             tries = 2
             length = len (pri)
             while tries < length:
-                ran = pri[pri[1]].schedule ()
+                ran = pri[pri[1]].schedule (now)
                 tries += 1
                 pri[1] += 1
                 if pri[1] >= length:
                     pri[1] = 2
                 if ran:
-                    return
+                    return True
+        return False
+
+
+    @micropython.native
+    def deadline_sched (self, now = None):
+        """!
+        Run tasks according to their priorities, checking only the timed
+        tasks whose run times have arrived.
+
+        This scheduler keeps the timed tasks in a heap ordered by their next
+        run times. Each time it is called, it reads the clock once and
+        releases the tasks at the top of the heap which have become due, so
+        tasks which aren't due yet cost nothing. It then runs the highest
+        priority task whose go flag is set, looking only at the priority
+        levels which have been marked ready as with @c flag_sched(); tasks of
+        equal priority take turns in round-robin order just as with
+        @c pri_sched(). Tasks in a list run
+        by this scheduler should not also be run with @c schedule(), as that
+        would move their run times without reordering the heap.
+        @param now The time from @c utime.ticks_us() to be used for this pass,
+               or @c None to read the clock here
+        @return @c True if a task ran or @c False if none was ready
+        """
+        # Release due tasks from the top of the heap. A task which is late by
+        # more than a period stays near the top after being released, so the
+        # number of releases in one pass is limited to the number of tasks.
+        # A task released more than once before it runs keeps a count of its
+        # releases and is run once for each
+        if now is None:
+            now = utime.ticks_us ()
+
+        heap = self._heap
+        tries = len (heap)
+        while tries > 0:
+            task = heap[0]
+            late = utime.ticks_diff (now, task._next_run)
+            if late <= 0:
+                break
+            task.release (late)
+            self._heap_sift_down ()
+            tries -= 1
+
+        return self.flag_sched (now)
+
+
+    @micropython.native
+    def flag_sched (self, now = None):
+        """!
+        Run the highest priority task whose go flag has been set.
+
+        This scheduler doesn't look at the time at all; it only checks the
+        tasks' go flags. When a task is released or its @c go() method is
+        called, the bit for its priority level is set in a mask of ready
+        levels, so this scheduler goes straight to the highest level with a
+        ready task instead of checking every task. Tasks at the same priority
+        are given turns in round-robin order. It is used when tasks are 
+        released by some other means, such as by the timer callbacks set up
+        by @c start_timers().
+        @param now The time at which the scheduler's pass began, used as the
+               start time for profiling the task which is run
+        @return @c True if a task was run or @c False if none was ready
+        """
+        if not self._masked:
+            self._use_mask ()
+
+        while self._ready:
+            # The lowest bit set in the mask is the highest ready priority
+            mask = self._ready
+            bit = mask & -mask
+            if pyb:
+                irq_state = pyb.disable_irq ()
+                self._ready &= ~bit
+                pyb.enable_irq (irq_state)
+            else:
+                self._ready &= ~bit
+
+            # Find the next ready task at this level in round-robin order and
+            # see whether another one is ready as well
+            pri = self.pri_list[self._bit_level[bit]]
+            length = len (pri)
+            idx = pri[1]
+            tries = 2
+            found = None
+            while tries < length:
+                task = pri[idx]
+                tries += 1
+                idx += 1
+                if idx >= length:
+                    idx = 2
+                if task.go_flag:
+                    if found is None:
+                        found = task
+                        pri[1] = idx
+                    else:
+                        found._mark_ready ()
+                        break
+
+            if found is not None:
+                found.run (now)
+                return True
+        return False
+
+
+    @micropython.native
+    def edf_sched (self, now = None):
+        """!
+        Run the ready task whose deadline is soonest.
+
+        This is an earliest-deadline-first scheduler. A timed task's deadline
+        is taken to be the end of its current period, which is the task's
+        next run time once it has been released. Among the ready timed tasks,
+        the one with the earliest deadline is run, whatever its priority.
+        Tasks which don't run on a timer have no deadlines, so they are run
+        only when no timed task is ready, highest priority first.
+        @param now The time from @c utime.ticks_us() to be used for this pass,
+               or @c None to read the clock here
+        @return @c True if a task ran or @c False if none was ready
+        """
+        if now is None:
+            now = utime.ticks_us ()
+
+        best = None
+        best_event = None
+        for pri in self.pri_list:
+            idx = 2
+            length = len (pri)
+            while idx < length:
+                task = pri[idx]
+                idx += 1
+                if task.ready (now):
+                    if task.period is None:
+                        if best_event is None:
+                            best_event = task
+                    elif best is None or utime.ticks_diff (task._next_run,
+                                                          best._next_run) < 0:
+                        best = task
+
+        if best is None:
+            best = best_event
+        if best is None:
+            return False
+        best.run (now)
+        return True
+
+
+    def assign_rm_priorities (self, background = ()):
+        """!
+        Set the priorities of the timed tasks by the rate-monotonic rule.
+
+        Tasks with shorter periods are given higher priorities; tasks with
+        the same period share a priority. Tasks which don't run on a timer
+        are usually woken by data from another task, as a motor task is woken
+        by a new duty cycle, and they should run as soon as that data arrives,
+        so they are placed above all the timed tasks, keeping their order
+        among themselves. Background tasks, such as a data recorder, keep
+        their own priorities and all other tasks are placed above them. This
+        method should be called again if task periods are changed.
+        @param background A sequence of tasks which are to stay below all
+               the other tasks, whether or not they run on a timer
+        """
+        tasks = []
+        for pri in self.pri_list:
+            for task in pri[2:]:
+                tasks.append (task)
+
+        # The other tasks' priorities start just above the background tasks
+        base = 0
+        for task in background:
+            if task.priority >= base:
+                base = task.priority + 1
+
+        # The longest period gets the lowest of the timed tasks' priorities
+        periods = []
+        for task in tasks:
+            if task.period != None and task not in background \
+                    and task.period not in periods:
+                periods.append (task.period)
+        periods.sort ()
+        for task in tasks:
+            if task.period != None and task not in background:
+                task.priority = base + len (periods) - 1 \
+                    - periods.index (task.period)
+
+        # Event-driven tasks go above the timed ones in their original order
+        base += len (periods)
+        event_pris = []
+        for task in tasks:
+            if task.period is None and task not in background \
+                    and task.priority not in event_pris:
+                event_pris.append (task.priority)
+        event_pris.sort ()
+        for task in tasks:
+            if task.period is None and task not in background:
+                task.priority = base + event_pris.index (task.priority)
+
+        # Rebuild the priority lists and heap with the new priorities
+        self.pri_list = []
+        self._heap = []
+        for task in tasks:
+            self.append (task)
+
+
+    def utilization (self, worst = True):
+        """!
+        Compute the fraction of CPU time used by the timed tasks, using the
+        run times measured by profiling. Each task's run time is divided by
+        its period and the results are added up.
+        @param worst If @c True, use each task's slowest measured run time;
+               if @c False, use the average run time
+        @return The total utilization, where 1.0 means the CPU is fully used
+        """
+        total = 0.0
+        for task in self._heap:
+            if not task._prof or task._runs <= 2:
+                raise ValueError ('No profile data for task ' + task.name)
+            if worst:
+                run_time = task._slowest
+            else:
+                run_time = task._run_sum / (task._runs - 2)
+            total += run_time / task.period
+        return total
+
+
+    def schedulable (self, policy = 'rm', worst = True):
+        """!
+        Check whether the timed tasks can meet their deadlines, using the
+        measured utilization. For earliest-deadline-first scheduling the
+        utilization must not exceed 1. For rate-monotonic scheduling it must
+        not exceed the Liu and Layland bound n(2^(1/n) - 1) for n tasks, or
+        1 if the periods are harmonic. The rate-monotonic test is sufficient
+        but not necessary, so a task set which fails it might still work.
+        @param policy Either @c 'rm' for rate-monotonic or @c 'edf' for 
+               earliest deadline first
+        @param worst If @c True, use the slowest measured run times; if
+               @c False, use average run times
+        @return @c True if the task set passes the test
+        """
+        use = self.utilization (worst)
+        if policy == 'edf':
+            bound = 1.0
+        elif policy == 'rm':
+            periods = self._periods ()
+            if self._harmonic (periods):
+                bound = 1.0
+            else:
+                num = len (self._heap)
+                bound = num * (2.0 ** (1.0 / num) - 1.0)
+        else:
+            raise ValueError ('Unknown scheduling policy ' + str (policy))
+        return use <= bound
+
+
+    def start_timers (self, make_timer):
+        """!
+        Release timed tasks from timer interrupts instead of by polling.
+
+        The timed tasks are sorted into groups having the same period, and a
+        timer is started for each group. The timer's callback only sets the
+        go flags of the tasks in its group, so it can safely run as an
+        interrupt service routine. After this method has been called the task
+        list should be run with @c flag_sched(), which dispatches the flagged
+        tasks without checking any times. Lateness isn't measured in this
+        mode, since the tasks' release times are set by the timers.
+        @code
+            free_timers = [6, 7, 9]
+
+            def make_timer (period_us, callback):
+                timer = pyb.Timer (free_timers.pop (), 
+                                   freq = 1000000 / period_us)
+                timer.callback (callback)
+                return timer
+
+            cotask.task_list.start_timers (make_timer)
+            cotask.task_list.run (sched = cotask.task_list.flag_sched)
+        @endcode
+        On a PC, @c SimTimer can be used as the timer factory.
+        @param make_timer A function which is called as
+               @c make_timer(period_us, callback) and which returns a timer
+               that calls @c callback(timer) once every @c period_us 
+               microseconds. The timer must have a @c deinit() method
+        """
+        self.stop_timers ()
+
+        # The timer callbacks set bits in the mask of ready levels, which is
+        # turned on before any timer can run
+        if not self._masked:
+            self._use_mask ()
+
+        # Find the groups of tasks which have the same period
+        groups = {}
+        for task in self._heap:
+            if task.period in groups:
+                groups[task.period].append (task)
+            else:
+                groups[task.period] = [task]
+
+        for period in groups:
+            group = ReleaseGroup (groups[period])
+            self._timers.append (make_timer (period, group.release))
+
+
+    def stop_timers (self):
+        """!
+        Stop the timers started by @c start_timers().
+        """
+        for timer in self._timers:
+            timer.deinit ()
+        self._timers = []
+
+
+    def _periods (self):
+        """!
+        Make a sorted list of the different periods of the timed tasks.
+        @return A list of periods in microseconds, shortest first
+        """
+        periods = []
+        for task in self._heap:
+            if task.period not in periods:
+                periods.append (task.period)
+        periods.sort ()
+        return periods
+
+
+    @staticmethod
+    def _harmonic (periods):
+        """!
+        Check whether each period in a sorted list is a multiple of all the
+        shorter ones.
+        @param periods A list of periods, shortest first
+        @return @c True if the periods are harmonic
+        """
+        for idx in range (1, len (periods)):
+            if periods[idx] % periods[idx - 1] != 0:
+                return False
+        return True
+
+
+    def build_cyclic (self, strict = True, max_frames = 1000):
+        """!
+        Build the table of minor frames used by the cyclic executive.
+
+        The minor frame is the greatest common divisor of the timed tasks'
+        periods and the hyperperiod (major frame) is their least common 
+        multiple. For each minor frame in the hyperperiod, a slot lists the
+        tasks which are due at the start of that frame, highest priority
+        first. If the periods aren't harmonic (each one a multiple of all
+        shorter ones), the table can become very long and the tasks aren't
+        run evenly, so this is an error unless @c strict is @c False. This
+        method must be called again if tasks are added or periods changed.
+        @param strict If @c True, raise an exception if the periods aren't
+               harmonic; if @c False, just print a warning
+        @param max_frames The largest number of minor frames allowed in the
+               table
+        @return The number of minor frames in the table
+        """
+        periods = self._periods ()
+        if not periods:
+            raise ValueError ('No timed tasks for cyclic schedule')
+
+        # Find the minor frame (GCD) and hyperperiod (LCM) of the periods
+        minor = periods[0]
+        major = periods[0]
+        for period in periods[1:]:
+            a, b = minor, period
+            while b:
+                a, b = b, a % b
+            minor = a
+            a, b = major, period
+            while b:
+                a, b = b, a % b
+            major = major * period // a
+
+        if not self._harmonic (periods):
+            if strict:
+                raise ValueError ('Task periods are not harmonic')
+            print ('Warning: task periods are not harmonic')
+
+        num_frames = major // minor
+        if num_frames > max_frames:
+            raise ValueError ('Cyclic schedule needs {:d} frames'.format (
+                num_frames))
+
+        # Make the table; each slot is a tuple of the tasks due in that frame
+        slots = []
+        for frame in range (num_frames):
+            slot = []
+            for pri in self.pri_list:
+                for task in pri[2:]:
+                    if task.period != None \
+                            and (frame * minor) % task.period == 0:
+                        slot.append (task)
+            slots.append (tuple (slot))
+
+        self._slots = tuple (slots)
+        self._minor = minor
+        self._frame_idx = 0
+        self._frame_time = utime.ticks_add (utime.ticks_us (), minor)
+        return num_frames
+
+
+    @micropython.native
+    def cyclic_sched (self, now = None):
+        """!
+        Run tasks from the table of minor frames made by @c build_cyclic().
+
+        When the next minor frame is due, every task in that frame's slot is
+        run, highest priority first, without any per-task readiness checks.
+        The frames are kept in step with the clock, so if a frame overruns,
+        the following frames are run back to back until they catch up.
+        Between frames, tasks which don't run on a timer are run if their go
+        flags have been set, as by @c flag_sched().
+        @param now The time from @c utime.ticks_us() to be used for this pass,
+               or @c None to read the clock here
+        @return @c True if any task ran or @c False if none was ready
+        """
+        if now is None:
+            now = utime.ticks_us ()
+
+        late = utime.ticks_diff (now, self._frame_time)
+        if late < 0:
+            return self.flag_sched (now)
+
+        slot = self._slots[self._frame_idx]
+        idx = 0
+        while idx < len (slot):
+            task = slot[idx]
+            task.release (late)
+            task.run (now)
+            now = utime.ticks_us ()
+            idx += 1
+
+        self._frame_idx += 1
+        if self._frame_idx >= len (self._slots):
+            self._frame_idx = 0
+        self._frame_time = utime.ticks_add (self._frame_time, self._minor)
+        return True
+
+
+    def run (self, sched = None, stop = None, max_sleep = 1000, idle = None):
+        """!
+        Run the scheduler repeatedly, sleeping whenever no task is ready.
+
+        Each time through the loop, the given scheduler method is called. If
+        it didn't run a task, this method finds the time at which the next
+        timed task is due and sleeps until then instead of spinning. On a
+        board the CPU is stopped with @c wait_for_interrupt(), so any
+        interrupt, including a timer callback which calls a task's @c go()
+        method, ends the nap at once. On a PC, where there's no @c pyb module,
+        @c utime.sleep_us() is used, in naps of at most @c max_sleep
+        microseconds. Between naps the flag @c Task.wakeup is checked so that
+        a task made ready by a call to @c go() is run without waiting for the
+        next timed task. Idle time is measured so that @c idle_percent() can
+        report it.
+        @code
+            # Run until a key is pressed
+            vcp = pyb.USB_VCP ()
+            cotask.task_list.run (stop = vcp.any)
+        @endcode
+        @param sched The scheduler method to be called on each pass, such as
+               @c pri_sched or @c deadline_sched. The default is @c pri_sched
+        @param stop A function which returns @c True when the loop should
+               stop, or @c None (the default) to run forever
+        @param max_sleep The longest time in microseconds to sleep at once
+        @param idle A function called with a number of microseconds to sleep
+               when no task is ready; the default is @c wait_for_interrupt
+               on a board or @c utime.sleep_us on a PC
+        """
+        if sched is None:
+            sched = self.pri_sched
+        if idle is None:
+            idle = utime.sleep_us if pyb is None else wait_for_interrupt
+
+        mark = utime.ticks_us ()
+        while stop is None or not stop ():
+            # Clear the wakeup flag before the pass so that a call to go()
+            # made during the pass keeps us from going to sleep afterwards
+            Task.wakeup = False
+            now = utime.ticks_us ()
+            if sched (now):
+                continue
+
+            # Nothing ran, so sleep until the next task is due or until an
+            # interrupt calls a task's go() method
+            due = self.next_due ()
+            start = utime.ticks_us ()
+            stime = start
+            while not Task.wakeup:
+                if due is None:
+                    nap = max_sleep
+                else:
+                    nap = utime.ticks_diff (due, stime)
+                    if nap <= 0:
+                        break
+                    if nap > max_sleep:
+                        nap = max_sleep
+                idle (nap)
+                stime = utime.ticks_us ()
+
+            # Add up idle and total times. The totals are halved now and then
+            # so they stay small integers; their ratio is all we need
+            self._idle_us += utime.ticks_diff (stime, start)
+            self._total_us += utime.ticks_diff (stime, mark)
+            mark = stime
+            if self._total_us > 0x10000000:
+                self._idle_us >>= 1
+                self._total_us >>= 1
+
+
+    @micropython.native
+    def next_due (self):
+        """!
+        Find the time at which the next timed task is due to run.
+        @return The @c utime.ticks_us() time of the earliest next run time of
+                any timed task (or of the next cyclic frame, once 
+                @c build_cyclic() has been called), or @c None if no tasks run
+                on a timer or the timed tasks are being released by timer
+                interrupts
+        """
+        if self._timers:
+            return None
+        if self._slots is not None:
+            return self._frame_time
+
+        due = None
+        for task in self._heap:
+            if due is None or utime.ticks_diff (task._next_run, due) < 0:
+                due = task._next_run
+        return due
+
+
+    def idle_percent (self):
+        """!
+        Compute the percentage of time in which no task was ready to run
+        while the scheduler was being run by @c run().
+        @return The idle time as a percentage, or @c None if @c run() hasn't
+                yet had to wait for a task
+        """
+        if self._total_us <= 0:
+            return None
+        return 100.0 * self._idle_us / self._total_us
 
 
     def __repr__ (self):
@@ -393,14 +1453,272 @@ class TaskList:
         Create some diagnostic text showing the tasks in the task list.
         """
         ret_str = 'TASK             PRI    PERIOD    RUNS   AVG DUR   MAX ' \
-            'DUR  AVG LATE  MAX LATE\n'
+            'DUR  AVG LATE  MAX LATE  MISSED\n'
         for pri in self.pri_list:
             for task in pri[2:]:
                 ret_str += str (task) + '\n'
 
+        idle = self.idle_percent ()
+        if idle is not None:
+            ret_str += 'Idle {: 5.1f}%\n'.format (idle)
+
+        # Add a table of run time and lateness percentiles for profiled tasks
+        pct_str = ''
+        for pri in self.pri_list:
+            for task in pri[2:]:
+                line = task.percentiles ()
+                if line is not None:
+                    pct_str += line + '\n'
+        if pct_str:
+            ret_str += '\nTASK              P50 DUR  P90 DUR  P99 DUR  MAX DUR' \
+                ' P50 LATE P90 LATE P99 LATE MAX LATE\n' + pct_str
+
+        # Add a table of end-to-end latencies if any are being measured
+        if latency_list:
+            ret_str += '\nLATENCY            COUNT      AVG      P50      P90' \
+                '      P99      MAX\n'
+            for probe in latency_list:
+                ret_str += str (probe) + '\n'
+
         return ret_str
 
 
+# =============================================================================
+
+class ReleaseGroup:
+    """!
+    A group of timed tasks which are released together by a timer.
+    Objects of this class are created by @c TaskList.start_timers(); the
+    @c release() method is used as the timer's callback.
+    """
+
+    def __init__ (self, tasks):
+        """!
+        Create a release group holding the given tasks.
+        @param tasks A list of the tasks which are to be released together
+        """
+        self._tasks = tuple (tasks)
+        self._num_tasks = len (self._tasks)
+
+
+    def release (self, timer):
+        """!
+        Call the @c go() methods of all the tasks in this group. This method
+        is meant to be called from a timer interrupt, so it doesn't allocate
+        memory.
+        @param timer The timer which called this method (not used)
+        """
+        idx = 0
+        while idx < self._num_tasks:
+            self._tasks[idx].go ()
+            idx += 1
+
+
+# =============================================================================
+
+class SimTimer:
+    """!
+    A stand-in for a hardware timer, used to run timer-driven code on a PC.
+
+    A simulated timer doesn't interrupt anything. Its callback is called from
+    @c poll(), once for each period which has elapsed since it was last
+    called. The @c sleep_us() method can be given to @c TaskList.run() as its
+    idle function so that all simulated timers are polled whenever the 
+    scheduler is idle:
+    @code
+        cotask.task_list.start_timers (cotask.SimTimer)
+        cotask.task_list.run (sched = cotask.task_list.flag_sched,
+                              idle = cotask.SimTimer.sleep_us)
+    @endcode
+    """
+    ## A list of all the simulated timers which are running
+    timers = []
+
+
+    def __init__ (self, period_us, callback = None):
+        """!
+        Create a simulated timer and start it running.
+        @param period_us The time in microseconds between callbacks
+        @param callback A function to be called as @c callback(timer) once
+               each period, or @c None for no callback yet
+        """
+        self.period = int (period_us)
+        self._callback = callback
+        self._next_time = utime.ticks_add (utime.ticks_us (), self.period)
+        SimTimer.timers.append (self)
+
+
+    def callback (self, fun):
+        """!
+        Set the function which is called each period, as with a @c pyb.Timer.
+        @param fun The callback function, or @c None to disable the callback
+        """
+        self._callback = fun
+
+
+    def deinit (self):
+        """!
+        Stop the simulated timer.
+        """
+        self._callback = None
+        if self in SimTimer.timers:
+            SimTimer.timers.remove (self)
+
+
+    def poll (self, now = None):
+        """!
+        Call the callback once for each period which has elapsed.
+        @param now The current time from @c utime.ticks_us(), or @c None to
+               read the clock here
+        """
+        if now is None:
+            now = utime.ticks_us ()
+        while utime.ticks_diff (now, self._next_time) >= 0:
+            self._fire ()
+
+
+    def _fire (self):
+        """!
+        Move the time of the next callback one period later and call the
+        callback, if there is one.
+        """
+        self._next_time = utime.ticks_add (self._next_time, self.period)
+        if self._callback is not None:
+            self._callback (self)
+
+
+    @staticmethod
+    def poll_all (now = None):
+        """!
+        Poll all the simulated timers which are running.
+        @param now The current time from @c utime.ticks_us(), or @c None to
+               read the clock here
+        """
+        if now is None:
+            now = utime.ticks_us ()
+        for timer in SimTimer.timers:
+            timer.poll (now)
+
+
+    @staticmethod
+    def _next_timer ():
+        """!
+        Find the running simulated timer whose callback is due soonest.
+        @return The timer, or @c None if no simulated timers are running
+        """
+        first = None
+        for timer in SimTimer.timers:
+            if first is None or utime.ticks_diff (timer._next_time,
+                                                  first._next_time) < 0:
+                first = timer
+        return first
+
+
+    @staticmethod
+    def sleep_us (time_us):
+        """!
+        Sleep for the given time, calling the simulated timers' callbacks as
+        they come due. The sleep is broken up so that the clock reaches each
+        callback's due time before that callback is called, earliest first,
+        so a callback which reads the time or a simulated counter sees its
+        own time, as it would if a hardware timer had interrupted. Callbacks
+        which were already overdue are called at once.
+        @param time_us The time to sleep in microseconds
+        """
+        end = utime.ticks_add (utime.ticks_us (), time_us)
+        while True:
+            timer = SimTimer._next_timer ()
+            if timer is None or utime.ticks_diff (end, timer._next_time) < 0:
+                break
+            wait = utime.ticks_diff (timer._next_time, utime.ticks_us ())
+            if wait > 0:
+                utime.sleep_us (wait)
+            timer._fire ()
+
+        wait = utime.ticks_diff (end, utime.ticks_us ())
+        if wait > 0:
+            utime.sleep_us (wait)
+
+
+# =============================================================================
+
+class LatencyProbe:
+    """!
+    A record of the latency through a chain of tasks, such as the time from
+    an encoder reading to the motor duty cycle computed from it being set.
+
+    The latency is measured by code at the end of the chain, usually using
+    the age of data in a timestamped share, and recorded with @c record().
+    A count, total, maximum and log-scaled histogram are kept without
+    allocating memory, so a probe can be left in place during real runs.
+    All probes are listed in @c latency_list and shown with the task table.
+
+    Example:
+      @code
+          # Where the motor task applies a new duty cycle
+          self.motor.set_duty_cycle (self.share_duty.get ())
+          self.latency.record (self.share_duty.age ())
+      @endcode
+    """
+
+    def __init__ (self, name):
+        """!
+        Create a latency probe and add it to the list of probes.
+        @param name A short name for the path whose latency is measured
+        """
+        self.name = name
+        self._hist = array.array ('L', range (HIST_BINS))
+        self.reset ()
+        latency_list.append (self)
+
+
+    def reset (self):
+        """!
+        Clear the latency statistics.
+        """
+        self._count = 0
+        self._sum = 0
+        self._max = 0
+        for idx in range (HIST_BINS):
+            self._hist[idx] = 0
+
+
+    @micropython.native
+    def record (self, latency):
+        """!
+        Record one latency measurement.
+        @param latency The latency in microseconds, or @c None (which is
+               ignored) if it couldn't be measured
+        """
+        if latency is None:
+            return
+        self._count += 1
+        self._sum += latency
+        if latency > self._max:
+            self._max = latency
+        hist_add (self._hist, latency)
+
+
+    def __repr__ (self):
+        """!
+        Show the probe's name, count, and the average, 50th, 90th and 99th
+        percentile and maximum latencies in milliseconds.
+        """
+        rst = '{:<16s}{: 8d}'.format (self.name, self._count)
+        if self._count > 0:
+            rst += '{: 9.3f}'.format (self._sum / self._count / 1000.0)
+            for pct in (50, 90, 99):
+                rst += '{: 9.3f}'.format (min (self._max,
+                    hist_percentile (self._hist, pct)) / 1000.0)
+            rst += '{: 9.3f}'.format (self._max / 1000.0)
+        return rst
+
+
+## A list of all the latency probes which have been created, used to print
+#  them with the task list's diagnostic printout.
+latency_list = []
+
+
 ## This is @b the main task list which is created for scheduling when 
 #  @c cotask.py is imported into a program. 
 task_list = TaskList ()
@@ -17,8 +17,9 @@ import cotask
 import task_share
 
 import TaskMotor
-import TaskEncoder
+import TaskEncoderBank
 import TaskController
+import TaskRecorder
         
 # This code creates a share, a queue, and two tasks, then starts the tasks. The
 # tasks run until somebody presses ENTER, at which time the scheduler stops and
@@ -26,18 +27,25 @@ import TaskController
 if __name__ == "__main__":    
     
     # Create a shares for motor duty cycle, controller setpoint, and encoder position
-    share_duty_1 = task_share.Share ('i', thread_protect = False, name = "share_duty_1")
+    # Duty cycle and position are timestamped to measure encoder-to-PWM latency
+    # Positions are in integer encoder ticks, converted to radians for printing.
+    # The positions and velocities of both axes are put together by the encoder
+    # bank task; each controller uses one item of the array as its own share.
+    # Velocities are in integer ticks/s, converted to rad/s for printing
+    share_pos = task_share.ArrayShare ('i', 2, thread_protect = False, name = "share_pos", timestamp = True)
+    share_vel = task_share.ArrayShare ('i', 2, thread_protect = False, name = "share_vel")
+    
+    share_duty_1 = task_share.Share ('i', thread_protect = False, name = "share_duty_1", timestamp = True)
     share_setpoint_1 = task_share.Share ('f', thread_protect = False, name = "share_setpoint_1")
-    share_pos_1 = task_share.Share ('f', thread_protect = False, name = "share_pos_1")
-    queue_pos_1 = task_share.Queue('f', 100, thread_protect = False, name = "queue_pos_1")
-    queue_enc1Times = task_share.Queue('f', 100, thread_protect = False, name = "queue_enc1Times")
+    share_pos_1 = share_pos.item(0)
+    # Each logged sample is one record holding the time [ms] and position [ticks]
+    queue_log_1 = task_share.RecordQueue('ii', 100, thread_protect = False, name = "queue_log_1")
     
     # Create a shares for second motor duty cycle, controller setpoint, and encoder position
-    share_duty_2 = task_share.Share ('i', thread_protect = False, name = "share_duty_2")
+    share_duty_2 = task_share.Share ('i', thread_protect = False, name = "share_duty_2", timestamp = True)
     share_setpoint_2 = task_share.Share ('f', thread_protect = False, name = "share_setpoint_2")
-    share_pos_2 = task_share.Share ('f', thread_protect = False, name = "share_pos_2")
-    queue_pos_2 = task_share.Queue('f', 100, thread_protect = False, name = "queue_pos_2")
-    queue_enc2Times = task_share.Queue('f', 100, thread_protect = False, name = "queue_enc2Times")
+    share_pos_2 = share_pos.item(1)
+    queue_log_2 = task_share.RecordQueue('ii', 100, thread_protect = False, name = "queue_log_2")
     
     # Create share flags to control states in tasks
     share_StartTime_1 = task_share.Share('i', thread_protect = False, name = "share_StartTime")
@@ -48,49 +56,60 @@ if __name__ == "__main__":
     # Initialize shared variables
     share_duty_1.put(0)
     share_setpoint_1.put(math.pi*2)
-    share_pos_1.put(0)
     share_duty_2.put(0)
     share_setpoint_2.put(math.pi*4)
-    share_pos_2.put(0)
     share_Stop_1.put(0)
     share_Stop_2.put(0)
     
     # Create task objects
-    motor1 = TaskMotor.TaskMotor(1, share_duty_1)
-    enco1 = TaskEncoder.TaskEncoder(1, share_pos_1, share_Stop_1)
-    control1 = TaskController.TaskController(share_setpoint_1, share_duty_1, share_pos_1, share_Stop_1, share_StartTime_1, queue_pos_1, queue_enc1Times)
+    motor1 = TaskMotor.TaskMotor(1, share_duty_1, cotask.LatencyProbe('Enc1->PWM1'))
+    control1 = TaskController.TaskController(share_setpoint_1, share_duty_1, share_pos_1, share_Stop_1, share_StartTime_1, queue_log_1)
     
-    motor2 = TaskMotor.TaskMotor(2, share_duty_2)
-    enco2 = TaskEncoder.TaskEncoder(2, share_pos_2, share_Stop_2)
-    control2 = TaskController.TaskController(share_setpoint_2, share_duty_2, share_pos_2, share_Stop_2, share_StartTime_2, queue_pos_2, queue_enc2Times)
+    motor2 = TaskMotor.TaskMotor(2, share_duty_2, cotask.LatencyProbe('Enc2->PWM2'))
+    control2 = TaskController.TaskController(share_setpoint_2, share_duty_2, share_pos_2, share_Stop_2, share_StartTime_2, queue_log_2)
+    
+    # One task reads both encoders
+    encoders = TaskEncoderBank.TaskEncoderBank([1, 2], share_pos, [share_Stop_1, share_Stop_2], share_vel)
 
     
     # Putting task objects in cotask run list
+    # Motor tasks have no period; they run whenever a new duty cycle is put
     task1_Mot = cotask.Task (motor1.task, name = 'Task1_Motor', priority = 1,
-                             period = 20, profile = True, trace = False)
+                             period = None, profile = True, trace = False)
     
-    task2_Enco = cotask.Task (enco1.task, name = 'Task2_Encoder', priority = 3, 
+    task2_Enco = cotask.Task (encoders.task, name = 'Task2_Encoders', priority = 3, 
                               period = 10, profile = True, trace = False)
     
     task3_Cont = cotask.Task (control1.task, name = 'Task3_Controller', priority = 5, 
-                              period = 20, profile = True, trace = False)
+                              period = 20, profile = True, trace = False,
+                              overrun = cotask.Task.OVERRUN_SKIP)
             
     task4_Mot2 = cotask.Task (motor2.task, name = 'Task4_Motor2', priority = 2,
-                              period = 20, profile = True, trace = False)
-    
-    task5_Enco2 = cotask.Task (enco2.task, name = 'Task5_Encoder2', priority = 4, 
-                               period = 10, profile = True, trace = False)
+                              period = None, profile = True, trace = False)
     
     task6_Cont2 = cotask.Task (control2.task, name = 'Task6_Controller2', priority = 6, 
-                               period = 20, profile = True, trace = False)
+                               period = 20, profile = True, trace = False,
+                               overrun = cotask.Task.OVERRUN_SKIP)
     
     cotask.task_list.append (task1_Mot)
     cotask.task_list.append (task2_Enco)
     cotask.task_list.append (task3_Cont)
     cotask.task_list.append (task4_Mot2)
-    cotask.task_list.append (task5_Enco2)
     cotask.task_list.append (task6_Cont2)    
     
+    # Wake each motor task when its controller puts a new duty cycle
+    share_duty_1.wake_on_put (task1_Mot)
+    share_duty_2.wake_on_put (task4_Mot2)
+    
+    # Flight recorder keeping the last 200 snapshots of every share, taken
+    # every RECORDER_PERIOD ms. It is made after all the shares so that each
+    # snapshot has room for them all
+    RECORDER_PERIOD = 50
+    recorder = TaskRecorder.TaskRecorder(frames = 200)
+    task7_Rec = cotask.Task (recorder.task, name = 'Task7_Recorder', priority = 0,
+                             period = RECORDER_PERIOD, profile = True, trace = False)
+    cotask.task_list.append (task7_Rec)
+    
     Contperiod = int(input("Set Controller Period: "))
     Contperiod2 = int(input("Set Second Controller Period: "))
     
@@ -98,20 +117,30 @@ if __name__ == "__main__":
     task3_Cont.set_period(Contperiod)
     task6_Cont2.set_period(Contperiod2)
     
+    # Give tasks with shorter periods higher priorities (rate monotonic),
+    # keeping the flight recorder below all the control tasks
+    cotask.task_list.assign_rm_priorities (background = [task7_Rec])
+    
     # Run the memory garbage collector to ensure memory is as defragmented as
     # possible before the real-time scheduler is started
     gc.collect ()
     
-    while True:
-        try:
-            cotask.task_list.pri_sched ()
-                
-        except KeyboardInterrupt:
-            print("End Program")
-            share_duty_1.put(0)
-            share_duty_2.put(0)
-            task1_Mot.schedule()
-            task4_Mot2.schedule()
-            break
+    # Run the scheduler, letting the CPU sleep whenever no task is due
+    try:
+        cotask.task_list.run ()
+            
+    except KeyboardInterrupt:
+        print("End Program")
+        share_duty_1.put(0)
+        share_duty_2.put(0)
+        task1_Mot.run()
+        task4_Mot2.run()
+        
+        # Show task profiles, encoder-to-PWM latencies and queue statistics
+        print('\n' + str(cotask.task_list))
+        print(task_share.show_all())
         
-    
\ No newline at end of file
+        # Save the flight recorder's history of the shares
+        with open('flight.bin', 'wb') as file:
+            recorder.dump(file)
+        print("Flight recorder saved to flight.bin")
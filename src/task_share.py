@@ -13,6 +13,8 @@ of data corruption by interrupts.
 import array
 import gc
 import pyb
+import struct
+import utime
 import micropython
 
 
@@ -20,6 +22,23 @@ import micropython
 #  used to create diagnostic printouts. 
 share_list = []
 
+## A dictionary in which each queue and share can be found by its name
+share_dict = {}
+
+## A dictionary holding a list of the queues and shares of each class, keyed
+#  by class name such as @c 'Queue' or @c 'Share'
+share_types = {}
+
+## A list of the shares holding a single number, including each item of an
+#  @c ArrayShare, in the order in which @c snapshot_all() copies them
+numeric_list = []
+
+## The shares in @c numeric_list which hold integers, in the same order
+int_list = []
+
+## The shares in @c numeric_list which hold floats, in the same order
+float_list = []
+
 ## This dictionary allows readable printouts of queue and share data types.
 type_code_strings = {'b' : "int8",   'B' : "uint8",
                      'h' : "int16",  'H' : "uint16",
@@ -39,6 +58,132 @@ def show_all ():
     return '\n'.join (gen)
 
 
+def get_share (name):
+    """!
+    Find a queue or share by the name it was given when it was created.
+    @param name The name of the queue or share to be found
+    @return The queue or share, or @c None if there isn't one of that name
+    """
+    return share_dict.get (name)
+
+
+def shares_of_type (share_type):
+    """!
+    Get a list of all the queues or shares which are of one class.
+    @param share_type The class, such as @c task_share.Share, or the name of
+           the class, such as @c 'Share'
+    @return A list of the queues or shares of that class, in the order in
+            which they were created; the list is empty if there are none
+    """
+    if not isinstance (share_type, str):
+        share_type = share_type.__name__
+    return share_types.get (share_type, [])
+
+
+def numeric_names (shares = None):
+    """!
+    Get the names of the numeric shares in the order in which their values
+    are placed into a buffer by @c snapshot_all(). This can be printed or
+    saved once as the header of a telemetry log.
+    @param shares @c int_list or @c float_list to get the names of only the
+           integer or float shares, or @c None for all the numeric shares
+    @return A list of the names of the shares
+    """
+    if shares is None:
+        shares = numeric_list
+    return [item._name for item in shares]
+
+
+def _add_numeric (share, type_code):
+    """!
+    Register a share holding a single number so that @c snapshot_all()
+    copies its value.
+    @param share The share, or the item of an @c ArrayShare
+    @param type_code The type code of the share's data
+    """
+    numeric_list.append (share)
+    if type_code in 'fd':
+        float_list.append (share)
+    else:
+        int_list.append (share)
+
+
+@micropython.native
+def snapshot_all (buffer, offset = 0, in_ISR = False, int_buffer = None,
+                  int_offset = 0, num = None, int_num = None):
+    """!
+    Copy the value of every numeric share into a preallocated array.
+
+    All the values are copied in one pass with interrupts disabled, so they
+    are consistent with one another, and no memory is allocated. This makes
+    it cheap enough to be called from a control loop for telemetry:
+    @code
+    frame = array.array ('f', [0] * len (task_share.numeric_list))
+    ...
+    task_share.snapshot_all (frame)
+    @endcode
+    A 32-bit float holds integers exactly only up to 2<sup>24</sup>, so if
+    large integers such as times or encoder positions must be kept exactly,
+    a second array (of type code @c 'i') can be given for the integer shares.
+    The float shares, in the order of @c float_list, then go into @c buffer
+    and the integer shares, in the order of @c int_list, into @c int_buffer:
+    @code
+    floats = array.array ('f', [0] * len (task_share.float_list))
+    ints = array.array ('i', [0] * len (task_share.int_list))
+    ...
+    task_share.snapshot_all (floats, int_buffer = ints)
+    @endcode
+    Shares are only ever added to the ends of the lists, so a buffer sized
+    for the shares which existed when it was allocated can be kept safe from
+    shares made later by giving those numbers of shares as @c num and
+    @c int_num; the later shares are then left out.
+    @param buffer An array (usually of type code @c 'f') into which the
+           values are written; it must have room for @c len(numeric_list)
+           items after @c offset, or for @c len(float_list) items if
+           @c int_buffer is given
+    @param offset The index in @c buffer at which the first value is placed
+    @param in_ISR Set this to @c True if calling from within an ISR
+    @param int_buffer An array into which the values of the integer shares
+           are written, or @c None to write all the values into @c buffer
+    @param int_offset The index in @c int_buffer at which the first integer
+           value is placed
+    @param num The largest number of values to be written into @c buffer,
+           or @c None to write the values of all the shares which go there
+    @param int_num The largest number of values to be written into
+           @c int_buffer, or @c None to write all the integer shares
+    @return The number of values which were copied
+    """
+    if not in_ISR:
+        irq_state = pyb.disable_irq ()
+
+    if int_buffer is None:
+        if num is None or num > len (numeric_list):
+            num = len (numeric_list)
+        idx = 0
+        while idx < num:
+            buffer[offset + idx] = numeric_list[idx]._buffer[0]
+            idx += 1
+    else:
+        if num is None or num > len (float_list):
+            num = len (float_list)
+        idx = 0
+        while idx < num:
+            buffer[offset + idx] = float_list[idx]._buffer[0]
+            idx += 1
+        num_ints = len (int_list)
+        if int_num is not None and int_num < num_ints:
+            num_ints = int_num
+        idx = 0
+        while idx < num_ints:
+            int_buffer[int_offset + idx] = int_list[idx]._buffer[0]
+            idx += 1
+        num += num_ints
+
+    if not in_ISR:
+        pyb.enable_irq (irq_state)
+    return num
+
+
 # ============================================================================
 
 class BaseShare:
@@ -55,12 +200,58 @@ class BaseShare:
         Create a base queue object when called by a child class initializer.
 
         This method creates the things which queues and shares have in common.
+        The child class must set @c self._name before calling this method so
+        that the queue or share can be registered under its name.
         """
         self._type_code = type_code
         self._thread_protect = thread_protect
 
-        # Add this queue to the global share and queue list
+        # Tasks whose go() methods are called when data is put in
+        self._wake_tasks = ()
+        self._num_wake = 0
+
+        # Add this queue to the global share and queue list and to the
+        # registries by which it can be found by name and by class
         share_list.append (self)
+        share_dict[self._name] = self
+        cls_name = type (self).__name__
+        if cls_name in share_types:
+            share_types[cls_name].append (self)
+        else:
+            share_types[cls_name] = [self]
+        if isinstance (self, Share):
+            _add_numeric (self, type_code)
+
+
+    def wake_on_put (self, *tasks):
+        """!
+        Make tasks ready to run whenever data is put into this queue or share.
+
+        Each time @c put() is called, the @c go() method of each of the given
+        tasks is called. A task which consumes the data can then be created
+        with no period, so that it runs only when there is new data for it
+        rather than waking up on a timer to check:
+        @code
+        motor_task = cotask.Task (motor.task, name = 'Motor', priority = 1,
+                                  period = None)
+        share_duty.wake_on_put (motor_task)
+        @endcode
+        @param tasks One or more @c cotask.Task objects to be woken
+        """
+        self._wake_tasks = self._wake_tasks + tasks
+        self._num_wake = len (self._wake_tasks)
+
+
+    @micropython.native
+    def _wake (self):
+        """!
+        Call the @c go() method of each task which is to be woken by a put.
+        This doesn't allocate memory, so it may be used from within an ISR.
+        """
+        idx = 0
+        while idx < self._num_wake:
+            self._wake_tasks[idx].go ()
+            idx += 1
 
 
 # ============================================================================
@@ -88,12 +279,35 @@ class Queue (BaseShare):
     # In another task, read data from the queue
     something = my_queue.get ()
     @endcode
+
+    If exactly one task (or ISR) puts data into a queue and exactly one other
+    task takes data out, the queue can be created in single-producer, 
+    single-consumer mode by setting @c spsc to @c True. The producer then
+    only changes the write index and the consumer only changes the read
+    index, so no count is shared between them and interrupts never need to
+    be disabled. In a cooperative multitasking system, @c try_put() and 
+    @c try_get() should be used rather than @c put() and @c get(), since
+    waiting for the other task to make room or provide data would wait
+    forever when that task can't run until this one yields:
+    @code
+    my_queue = task_share.Queue ('h', 32, spsc = True, name = "Fast Queue")
+
+    # In the producer task
+    if not my_queue.try_put (some_data):
+        # The queue was full, so handle the lost data here
+        ...
+
+    # In the consumer task
+    something = my_queue.try_get ()
+    if something is not None:
+        do_something_with (something)
+    @endcode
     """
     ## A counter used to give serial numbers to queues for diagnostic use.
     ser_num = 0
 
     def __init__ (self, type_code, size, thread_protect = True, 
-                  overwrite = False, name = None):
+                  overwrite = False, name = None, spsc = False):
         """!
         Initialize a queue object to carry and buffer data between tasks.
 
@@ -120,20 +334,33 @@ class Queue (BaseShare):
                data if the queue becomes full 
         @param name A short name for the queue, default @c QueueN where @c N
                is a serial number for the queue
+        @param spsc If @c True, the queue is used by a single producer and a
+               single consumer and works without disabling interrupts. Such
+               a queue can't overwrite old data
 
         """
-        # First call the parent class initializer
-        super ().__init__ (type_code, thread_protect, name)
+        if spsc and overwrite:
+            raise ValueError ('A single-producer queue cannot overwrite data')
 
-        self._size = size
-        self._overwrite = overwrite
+        # The name is chosen first so the share is registered under it
         self._name = str (name) if name != None \
             else 'Queue' + str (Queue.ser_num)
         Queue.ser_num += 1
 
+        # Then call the parent class initializer
+        super ().__init__ (type_code, thread_protect, name)
+
+        self._size = size
+        self._overwrite = overwrite
+
+        # In SPSC mode one slot is always left empty, so that a full queue
+        # can be told from an empty one by looking only at the two indices
+        self._spsc = spsc
+        self._slots = size + 1 if spsc else size
+
         # Allocate memory in which the queue's data will be stored
         try:
-            self._buffer = array.array (type_code, range (size))
+            self._buffer = array.array (type_code, range (self._slots))
         except MemoryError:
             self._buffer = None
             raise
@@ -141,6 +368,9 @@ class Queue (BaseShare):
             self._buffer = None
             raise
 
+        # A memoryview of the buffer, used to give zero-copy access to data
+        self._view = memoryview (self._buffer)
+
         # Initialize pointers to be used for reading and writing data
         self.clear ()
 
@@ -171,36 +401,57 @@ class Queue (BaseShare):
         @param item The item to be placed into the queue
         @param in_ISR Set this to @c True if calling from within an ISR
         """
+        # A single-producer queue doesn't need interrupts to be disabled
+        if self._spsc:
+            if not self._spsc_put (item):
+                if in_ISR:
+                    self._dropped += 1
+                    return
+                self._blocked += 1
+                while not self._spsc_put (item):
+                    pass
+            return
+
         # If we're in an ISR and the queue is full and we're not allowed to
         # overwrite data, we have to give up and exit
-        if self.full ():
+        if self.full () and not self._overwrite:
             if in_ISR:
+                self._dropped += 1
                 return
 
-            # Wait (if needed) until there's room in the buffer for the data
-            if not self._overwrite:
-                while self.full ():
-                    pass
+            # Wait until there's room in the buffer for the data
+            self._blocked += 1
+            while self.full ():
+                pass
 
         # Prevent data corruption by blocking interrupts during data transfer
         if self._thread_protect and not in_ISR:
             _irq_state = pyb.disable_irq ()
 
-        # Write the data and advance the counts and pointers
+        # Write the data and advance the counts and pointers. If the queue
+        # was full, the oldest item has just been overwritten, so the read
+        # pointer moves past it
         self._buffer[self._wr_idx] = item
         self._wr_idx += 1
         if self._wr_idx >= self._size:
             self._wr_idx = 0
-        self._num_items += 1
-        if self._num_items >= self._size:        # Can't be fuller than full
-            self._num_items = self._size
+        if self._num_items >= self._size:
+            self._rd_idx = self._wr_idx
+            self._dropped += 1
+        else:
+            self._num_items += 1
         if self._num_items > self._max_full:     # Record maximum fillage
             self._max_full = self._num_items
+        self._check_full ()
 
         # Re-enable interrupts
         if self._thread_protect and not in_ISR:
             pyb.enable_irq (_irq_state)
 
+        # Wake up any tasks which are waiting for this data
+        if self._num_wake:
+            self._wake ()
+
 
     @micropython.native
     def get (self, in_ISR = False):
@@ -227,6 +478,10 @@ class Queue (BaseShare):
         while self.empty ():
             pass
 
+        # A single-consumer queue doesn't need interrupts to be disabled
+        if self._spsc:
+            return self.try_get ()
+
         # Prevent data corruption by blocking interrupts during data transfer
         if self._thread_protect and not in_ISR:
             irq_state = pyb.disable_irq ()
@@ -241,6 +496,7 @@ class Queue (BaseShare):
         self._num_items -= 1
         if self._num_items < 0:
             self._num_items = 0
+        self._check_full ()
 
         # Re-enable interrupts
         if self._thread_protect and not in_ISR:
@@ -249,6 +505,302 @@ class Queue (BaseShare):
         return (to_return)
 
 
+    @micropython.native
+    def try_put (self, item, in_ISR = False):
+        """!
+        Put an item into the queue if there's room for it, without waiting.
+
+        If the queue was created with @c overwrite set, the item is always
+        put into the queue, overwriting the oldest data if necessary. 
+        @param item The item to be placed into the queue
+        @param in_ISR Set this to @c True if calling from within an ISR
+        @return @c True if the item was put into the queue, @c False if the
+                queue was full
+        """
+        if not self._spsc:
+            if self.full () and not self._overwrite:
+                self._dropped += 1
+                return False
+            self.put (item, in_ISR)
+            return True
+
+        if not self._spsc_put (item):
+            self._dropped += 1
+            return False
+        return True
+
+
+    @micropython.native
+    def _spsc_put (self, item):
+        """!
+        Put an item into a single-producer queue if there's room for it.
+        @param item The item to be placed into the queue
+        @return @c True if the item was put into the queue, @c False if the
+                queue was full
+        """
+        # Write the item, then publish it by moving the write index. Only the
+        # producer ever changes the write index
+        wr_idx = self._wr_idx + 1
+        if wr_idx >= self._slots:
+            wr_idx = 0
+        if wr_idx == self._rd_idx:
+            return False
+        self._buffer[self._wr_idx] = item
+        self._wr_idx = wr_idx
+
+        num = self.num_in ()
+        if num > self._max_full:
+            self._max_full = num
+
+        # Wake up any tasks which are waiting for this data
+        if self._num_wake:
+            self._wake ()
+        return True
+
+
+    @micropython.native
+    def try_get (self, default = None, in_ISR = False):
+        """!
+        Read an item from the queue if there is one, without waiting.
+        @param default The value to be returned if the queue is empty
+        @param in_ISR Set this to @c True if calling from within an ISR
+        @return The oldest item in the queue, or @c default if it's empty
+        """
+        if not self._spsc:
+            if self.empty ():
+                return default
+            return self.get (in_ISR)
+
+        # Read the item, then free its slot by moving the read index. Only
+        # the consumer ever changes the read index
+        rd_idx = self._rd_idx
+        if rd_idx == self._wr_idx:
+            return default
+        to_return = self._buffer[rd_idx]
+        rd_idx += 1
+        if rd_idx >= self._slots:
+            rd_idx = 0
+        self._rd_idx = rd_idx
+        return to_return
+
+
+    @micropython.native
+    def put_many (self, items, in_ISR = False):
+        """!
+        Put a sequence of items into the queue.
+
+        All the items are written with interrupts disabled only once, which
+        is much faster than calling @c put() for each item. This method 
+        doesn't wait for room in the queue. If the queue was created with
+        @c overwrite set, all the items are written and the oldest data is
+        overwritten as needed; if not, only as many items as fit are written.
+        @param items A sequence of items, such as a list or an @c array
+        @param in_ISR Set this to @c True if calling from within an ISR
+        @return The number of items which were put into the queue
+        """
+        num = len (items)
+
+        # A single-producer queue publishes all the items at once by moving
+        # the write index after they've been written. Only the consumer can
+        # change the free space meanwhile, and it can only make more
+        if self._spsc:
+            free = self._size - self.num_in ()
+            if num > free:
+                self._dropped += num - free
+                num = free
+            wr_idx = self._wr_idx
+            idx = 0
+            while idx < num:
+                self._buffer[wr_idx] = items[idx]
+                wr_idx += 1
+                if wr_idx >= self._slots:
+                    wr_idx = 0
+                idx += 1
+            self._wr_idx = wr_idx
+            if self.num_in () > self._max_full:
+                self._max_full = self.num_in ()
+            if num > 0 and self._num_wake:
+                self._wake ()
+            return num
+
+        # Prevent data corruption by blocking interrupts during data transfer.
+        # The free space is checked with interrupts disabled as well, so an
+        # ISR can't fill the queue between the check and the copy
+        if self._thread_protect and not in_ISR:
+            irq_state = pyb.disable_irq ()
+
+        if not self._overwrite and num > self._size - self._num_items:
+            self._dropped += num - (self._size - self._num_items)
+            num = self._size - self._num_items
+
+        idx = 0
+        while idx < num:
+            self._buffer[self._wr_idx] = items[idx]
+            self._wr_idx += 1
+            if self._wr_idx >= self._size:
+                self._wr_idx = 0
+            # If the queue was full, the oldest item was just overwritten
+            if self._num_items >= self._size:
+                self._rd_idx = self._wr_idx
+                self._dropped += 1
+            else:
+                self._num_items += 1
+            idx += 1
+        if self._num_items > self._max_full:
+            self._max_full = self._num_items
+        self._check_full ()
+
+        # Re-enable interrupts
+        if self._thread_protect and not in_ISR:
+            pyb.enable_irq (irq_state)
+
+        # Wake up any tasks which are waiting for this data
+        if num > 0 and self._num_wake:
+            self._wake ()
+
+        return num
+
+
+    @micropython.native
+    def get_into (self, buf, in_ISR = False):
+        """!
+        Read as many items from the queue as are available and will fit into
+        a buffer.
+
+        The items are copied with interrupts disabled only once, which is
+        much faster than calling @c get() for each item. This method doesn't
+        wait for data; if the queue is empty, nothing is read.
+        @code
+        |   samples = array.array ('f', range (32))
+        |   ...
+        |   num = my_queue.get_into (samples)
+        |   for idx in range (num):
+        |       do_something_with (samples[idx])
+        @endcode
+        @param buf An @c array, @c memoryview or list into which items are
+               copied, starting at index 0
+        @param in_ISR Set this to @c True if calling from within an ISR
+        @return The number of items which were copied into @c buf
+        """
+        # A single-consumer queue frees all the slots at once by moving the
+        # read index after the items have been copied
+        if self._spsc:
+            num = len (buf)
+            if num > self.num_in ():
+                num = self.num_in ()
+            rd_idx = self._rd_idx
+            idx = 0
+            while idx < num:
+                buf[idx] = self._buffer[rd_idx]
+                rd_idx += 1
+                if rd_idx >= self._slots:
+                    rd_idx = 0
+                idx += 1
+            self._rd_idx = rd_idx
+            return num
+
+        # Prevent data corruption by blocking interrupts during data transfer
+        if self._thread_protect and not in_ISR:
+            irq_state = pyb.disable_irq ()
+
+        num = len (buf)
+        if num > self._num_items:
+            num = self._num_items
+
+        idx = 0
+        while idx < num:
+            buf[idx] = self._buffer[self._rd_idx]
+            self._rd_idx += 1
+            if self._rd_idx >= self._size:
+                self._rd_idx = 0
+            idx += 1
+        self._num_items -= num
+        self._check_full ()
+
+        # Re-enable interrupts
+        if self._thread_protect and not in_ISR:
+            pyb.enable_irq (irq_state)
+
+        return num
+
+
+    def peek_view (self):
+        """!
+        Get zero-copy views of the items in the queue without removing them.
+
+        Because the queue is a ring buffer, its contents may wrap around the
+        end of the buffer, so two @c memoryview slices are returned; the
+        items in the first are older than those in the second, and either
+        may be empty. Once the items have been used, they can be removed
+        with @c skip(). The views show the buffer itself, so items may be
+        changed if more data is put into a queue which allows overwriting
+        while the views are being used.
+        @code
+        |   older, newer = my_queue.peek_view ()
+        |   stream.write (older)
+        |   stream.write (newer)
+        |   my_queue.skip (len (older) + len (newer))
+        @endcode
+        @return A tuple of two @c memoryview objects holding the items which
+                are in the queue, oldest first
+        """
+        protect = self._thread_protect and not self._spsc
+        if protect:
+            irq_state = pyb.disable_irq ()
+        rd_idx = self._rd_idx
+        num = self.num_in ()
+        if protect:
+            pyb.enable_irq (irq_state)
+
+        first = self._slots - rd_idx
+        if first > num:
+            first = num
+        return (self._view[rd_idx:rd_idx + first], self._view[0:num - first])
+
+
+    def skip (self, num, in_ISR = False):
+        """!
+        Remove items from the queue without reading them, as after the items
+        have been used through views from @c peek_view().
+        @param num The number of items to remove; if there are fewer items
+               in the queue than this, the queue is emptied
+        @param in_ISR Set this to @c True if calling from within an ISR
+        """
+        if self._spsc:
+            if num > self.num_in ():
+                num = self.num_in ()
+            self._rd_idx = (self._rd_idx + num) % self._slots
+            return
+
+        if self._thread_protect and not in_ISR:
+            irq_state = pyb.disable_irq ()
+
+        if num > self._num_items:
+            num = self._num_items
+        self._rd_idx = (self._rd_idx + num) % self._size
+        self._num_items -= num
+        self._check_full ()
+
+        if self._thread_protect and not in_ISR:
+            pyb.enable_irq (irq_state)
+
+
+    @micropython.native
+    def _check_full (self):
+        """!
+        Keep track of how long the queue has been full. This is called after
+        items are put into or taken out of a queue which isn't in SPSC mode,
+        while interrupts are disabled.
+        """
+        if self._num_items >= self._size:
+            if self._full_since < 0:
+                self._full_since = utime.ticks_us ()
+        elif self._full_since >= 0:
+            self._full_us += utime.ticks_diff (utime.ticks_us (), 
+                                               self._full_since)
+            self._full_since = -1
+
+
     @micropython.native
     def any (self):
         """!
@@ -258,6 +810,8 @@ class Queue (BaseShare):
         if the queue is empty.
         @return @c True if items are in the queue, @c False if not
         """
+        if self._spsc:
+            return (self._wr_idx != self._rd_idx)
         return (self._num_items > 0)
 
 
@@ -270,6 +824,8 @@ class Queue (BaseShare):
         there are any items therein.
         @return @c True if queue is empty, @c False if it's not empty
         """
+        if self._spsc:
+            return (self._wr_idx == self._rd_idx)
         return (self._num_items <= 0)
 
 
@@ -282,7 +838,7 @@ class Queue (BaseShare):
         is no room for more data without overwriting existing data. 
         @return @c True if the queue is full
         """
-        return (self._num_items >= self._size)
+        return (self.num_in () >= self._size)
 
 
     @micropython.native
@@ -294,132 +850,228 @@ class Queue (BaseShare):
         queue.
         @return The number of items in the queue
         """
+        if self._spsc:
+            num = self._wr_idx - self._rd_idx
+            if num < 0:
+                num += self._slots
+            return num
         return (self._num_items)
 
 
     def clear (self):
         """!
-        Remove all contents from the queue.
+        Remove all contents from the queue and reset its statistics.
         """
         self._rd_idx = 0
         self._wr_idx = 0
         self._num_items = 0
         self._max_full = 0
+        self._dropped = 0
+        self._blocked = 0
+        self._full_us = 0
+        self._full_since = -1
+
+
+    def stats (self):
+        """!
+        Get statistics about the queue's use in a form easily used by code.
+        Dropped items are those which were overwritten or which couldn't be
+        put into the queue because it was full; blocked puts are calls to
+        @c put() which had to wait for room. The time for which the queue
+        has been full isn't measured in SPSC mode.
+        @return A dictionary holding the queue's name, size, the numbers of
+                items now in the queue and at most, the numbers of dropped
+                items and blocked puts, and the time in milliseconds during
+                which the queue has been full
+        """
+        full_us = self._full_us
+        if self._full_since >= 0:
+            full_us += utime.ticks_diff (utime.ticks_us (), self._full_since)
+        return {'name' : self._name, 'size' : self._size, 
+                'num_in' : self.num_in (), 'max_full' : self._max_full,
+                'dropped' : self._dropped, 'blocked' : self._blocked,
+                'full_ms' : full_us // 1000}
 
 
     def __repr__ (self):
         """!
         This method puts diagnostic information about the queue into a string.
 
-        It shows the queue's name and type as well as the maximum number of
-        items and queue size. 
+        It shows the queue's name and type, the maximum number of items and
+        queue size, and the numbers of dropped items and blocked puts and
+        the time for which the queue has been full. 
         """
-        return ('{:<12s} Queue<{:s}> Max Full {:d}/{:d}'.format (self._name,
-                type_code_strings[self._type_code], self._max_full, self._size))
+        stats = self.stats ()
+        return ('{:<12s} Queue<{:s}> Max Full {:d}/{:d} Dropped {:d} '
+                'Blocked {:d} Full {:d} ms'.format (self._name,
+                type_code_strings[self._type_code], self._max_full, self._size,
+                stats['dropped'], stats['blocked'], stats['full_ms']))
 
 
 # ============================================================================
 
-class Share (BaseShare):
+class RecordQueue (BaseShare):
     """!
-    An item which holds data to be shared between tasks.
-    This class implements a shared data item which can be protected against
-    data corruption by pre-emptive multithreading. Multithreading which can
-    corrupt shared data includes the use of ordinary interrupts as well as the
-    use of pre-emptive multithreading such as by a Real-Time Operating System
-    (RTOS).
- 
-    An example of the creation and use of a share is as follows:
+    A queue which carries records made of several fields between tasks.
+
+    Each record is laid out according to a format string as used by the
+    @c struct module, and all records are kept in one buffer allocated when
+    the queue is created. The fields of a record are put into the queue
+    and taken out together, so values which belong together (such as a time
+    and the position measured at that time) can't get out of step as they
+    could if each were kept in a separate queue. 
+
+    An example of the creation and use of a record queue is as follows:
+
     @code
     import task_share
 
-    # This share holds a signed short (16-bit) integer
-    my_share = task_share.Queue ('h', name="My Share")
+    # This queue holds records of a time (int) and a position (float)
+    log_queue = task_share.RecordQueue ('if', 100, name="Log Queue")
 
-    # Somewhere in one task, put data into the share
-    my_share.put (some_data)
+    # Somewhere in one task, put records into the queue
+    if not log_queue.full ():
+        log_queue.put (time, position)
 
-    # In another task, read data from the share
-    something = my_share.get ()
+    # In another task, read records from the queue
+    while log_queue.any ():
+        time, position = log_queue.get ()
+
+    # Or send all the records to a stream as raw bytes at once
+    log_queue.write_to (stream)
     @endcode
     """
-    ## A counter used to give serial numbers to shares for diagnostic use.
+    ## A counter used to give serial numbers to queues for diagnostic use.
     ser_num = 0
 
-
-    def __init__ (self, type_code, thread_protect = True, name = None):
+    def __init__ (self, fmt, size, thread_protect = True, overwrite = False,
+                  name = None):
         """!
-        Create a shared data item used to transfer data between tasks.
+        Initialize a record queue by allocating memory for the records.
 
-        This method allocates memory in which the shared data will be buffered.
+        @param fmt A @c struct format string describing each record, such as
+               @c 'if' for an integer followed by a float
+        @param size The maximum number of records which the queue can hold
+        @param thread_protect @c True if mutual exclusion protection is used
+        @param overwrite If @c True, oldest records will be overwritten with
+               new ones if the queue becomes full 
+        @param name A short name for the queue, default @c RecordQueueN where
+               @c N is a serial number for the queue
+        """
+        # The name is chosen first so the share is registered under it
+        self._name = str (name) if name != None \
+            else 'RecordQueue' + str (RecordQueue.ser_num)
+        RecordQueue.ser_num += 1
 
-        Each share can only carry data of one particular type which must be
-        chosen from the following list. The data type is specified by a 
-        one-letter type code which is given as for the Python @c array.array
-        type, which can be any of the following:
-        |      |      |      |
-        |:-----|:-----|:-----|
-        | **b** (signed char) | **B** (unsigned char) | 8 bit integers |
-        | **h** (signed short) | **H** (unsigned short) | 16 bit integers |
-        | **i** (signed int) | **I** (unsigned int) | 32 bit integers (probably) |
-        | **l** (signed long) | **L** (unsigned long) | 32 bit integers |
-        | **q** (signed long long) | **Q** (unsigned long long) | 64 bit integers |
-        | **f** (float) | **d** (double-precision float) | |
+        # Then call the parent class initializer
+        super ().__init__ (fmt, thread_protect, name)
 
-        @param type_code The type of data items which the share can hold
-        @param thread_protect True if mutual exclusion protection is used
-        @param name A short name for the share, default @c ShareN where @c N
-               is a serial number for the share
-        """
-        # First call the parent class initializer
-        super ().__init__ (type_code, thread_protect, name)
+        self._size = size
+        self._overwrite = overwrite
 
-        self._buffer = array.array (type_code, [0])
+        # Allocate memory in which the records will be stored
+        self._rec_size = struct.calcsize (fmt)
+        self._buffer = bytearray (self._rec_size * size)
+        self._view = memoryview (self._buffer)
 
-        self._name = str (name) if name != None \
-            else 'Share' + str (Share.ser_num)
-        Share.ser_num += 1
+        # Initialize pointers to be used for reading and writing records
+        self.clear ()
 
+        # Since we may have allocated a bunch of memory, call the garbage
+        # collector to neaten up what memory is left for future use
+        gc.collect ()
 
-    @micropython.native
-    def put (self, data, in_ISR = False):
-        """!
-        Write an item of data into the share.
 
-        This method puts data into the share; any old data is overwritten.
-        This code disables interrupts during the writing so as to prevent
-        data corrupting by an interrupt service routine which might access
-        the same data.
-        @param data The data to be put into this share
-        @param in_ISR Set this to True if calling from within an ISR
+    def put (self, *fields, in_ISR = False):
+        """!
+        Put a record into the queue.
+
+        If there isn't room for the record, wait (blocking the calling 
+        process) until room becomes available, unless the @c overwrite 
+        constructor parameter was set to @c True to allow old records to be
+        clobbered. To avoid waiting, check @c full() first or use 
+        @c try_put().
+        @param fields The values of the fields of the record, in order
+        @param in_ISR Set this to @c True if calling from within an ISR
         """
+        if self.full () and not self._overwrite:
+            if in_ISR:
+                self._dropped += 1
+                return
+            self._blocked += 1
+            while self.full ():
+                pass
 
-        # Disable interrupts before writing the data
+        # Prevent data corruption by blocking interrupts during data transfer
         if self._thread_protect and not in_ISR:
             irq_state = pyb.disable_irq ()
 
-        self._buffer[0] = data
+        # Write the record and advance the counts and pointers. If the queue
+        # was full, the oldest record has been overwritten
+        struct.pack_into (self._type_code, self._buffer,
+                          self._wr_idx * self._rec_size, *fields)
+        self._wr_idx += 1
+        if self._wr_idx >= self._size:
+            self._wr_idx = 0
+        if self._num_items >= self._size:
+            self._rd_idx = self._wr_idx
+            self._dropped += 1
+        else:
+            self._num_items += 1
+        if self._num_items > self._max_full:
+            self._max_full = self._num_items
+        self._check_full ()
 
         # Re-enable interrupts
         if self._thread_protect and not in_ISR:
             pyb.enable_irq (irq_state)
 
+        # Wake up any tasks which are waiting for this data
+        if self._num_wake:
+            self._wake ()
+
+
+    def try_put (self, *fields, in_ISR = False):
+        """!
+        Put a record into the queue if there's room for it, without waiting.
+        If the queue allows overwriting, the record is always put in.
+        @param fields The values of the fields of the record, in order
+        @param in_ISR Set this to @c True if calling from within an ISR
+        @return @c True if the record was put into the queue, @c False if the
+                queue was full
+        """
+        if self.full () and not self._overwrite:
+            self._dropped += 1
+            return False
+        self.put (*fields, in_ISR = in_ISR)
+        return True
+
 
-    @micropython.native
     def get (self, in_ISR = False):
         """!
-        Read an item of data from the share.
+        Read a record from the queue.
 
-        If thread protection is enabled, interrupts are disabled during the time
-        that the data is being read so as to prevent data corruption by changes
-        in the data as it is being read. 
-        @param in_ISR Set this to True if calling from within an ISR
+        If there isn't anything in there, wait (blocking the calling process)
+        until something becomes available. To avoid waiting, check @c any()
+        first or use @c try_get().
+        @param in_ISR Set this to @c True if calling from within an ISR
+        @return A tuple holding the values of the record's fields
         """
-        # Disable interrupts before reading the data
+        # Wait until there's something in the queue to be returned
+        while self.empty ():
+            pass
+
+        # Prevent data corruption by blocking interrupts during data transfer
         if self._thread_protect and not in_ISR:
             irq_state = pyb.disable_irq ()
 
-        to_return = self._buffer[0]
+        to_return = struct.unpack_from (self._type_code, self._buffer,
+                                        self._rd_idx * self._rec_size)
+        self._rd_idx += 1
+        if self._rd_idx >= self._size:
+            self._rd_idx = 0
+        self._num_items -= 1
+        self._check_full ()
 
         # Re-enable interrupts
         if self._thread_protect and not in_ISR:
@@ -428,7 +1080,407 @@ class Share (BaseShare):
         return (to_return)
 
 
-    def __repr__ (self):
+    def try_get (self, default = None, in_ISR = False):
+        """!
+        Read a record from the queue if there is one, without waiting.
+        @param default The value to be returned if the queue is empty
+        @param in_ISR Set this to @c True if calling from within an ISR
+        @return A tuple holding the fields of the oldest record in the queue,
+                or @c default if the queue is empty
+        """
+        if self.empty ():
+            return default
+        return self.get (in_ISR)
+
+
+    def peek_view (self):
+        """!
+        Get zero-copy views of the records in the queue without removing
+        them. Two @c memoryview slices of raw bytes are returned, since the
+        records may wrap around the end of the buffer; the records in the
+        first are older than those in the second. Once they have been used,
+        the records can be removed with @c skip().
+        @return A tuple of two @c memoryview objects holding the bytes of the
+                records in the queue, oldest first
+        """
+        if self._thread_protect:
+            irq_state = pyb.disable_irq ()
+        rd_idx = self._rd_idx
+        num = self._num_items
+        if self._thread_protect:
+            pyb.enable_irq (irq_state)
+
+        first = self._size - rd_idx
+        if first > num:
+            first = num
+        start = rd_idx * self._rec_size
+        return (self._view[start:start + first * self._rec_size],
+                self._view[0:(num - first) * self._rec_size])
+
+
+    def skip (self, num, in_ISR = False):
+        """!
+        Remove records from the queue without reading them.
+        @param num The number of records to remove; if there are fewer in the
+               queue than this, the queue is emptied
+        @param in_ISR Set this to @c True if calling from within an ISR
+        """
+        if self._thread_protect and not in_ISR:
+            irq_state = pyb.disable_irq ()
+
+        if num > self._num_items:
+            num = self._num_items
+        self._rd_idx = (self._rd_idx + num) % self._size
+        self._num_items -= num
+        self._check_full ()
+
+        if self._thread_protect and not in_ISR:
+            pyb.enable_irq (irq_state)
+
+
+    @micropython.native
+    def _check_full (self):
+        """!
+        Keep track of how long the queue has been full. This is called after
+        records are put into or taken out of the queue.
+        """
+        if self._num_items >= self._size:
+            if self._full_since < 0:
+                self._full_since = utime.ticks_us ()
+        elif self._full_since >= 0:
+            self._full_us += utime.ticks_diff (utime.ticks_us (), 
+                                               self._full_since)
+            self._full_since = -1
+
+
+    def write_to (self, stream):
+        """!
+        Write all the records in the queue to a stream as raw bytes, oldest
+        first, and remove them from the queue. The bytes can be decoded on
+        the receiving end with @c struct.unpack() using this queue's format.
+        @param stream An object with a @c write() method, such as a file or
+               a serial port
+        @return The number of records which were written
+        """
+        older, newer = self.peek_view ()
+        stream.write (older)
+        stream.write (newer)
+        num = (len (older) + len (newer)) // self._rec_size
+        self.skip (num)
+        return num
+
+
+    @micropython.native
+    def any (self):
+        """!
+        Check if there are any records in the queue.
+        @return @c True if records are in the queue, @c False if not
+        """
+        return (self._num_items > 0)
+
+
+    @micropython.native
+    def empty (self):
+        """!
+        Check if the queue is empty.
+        @return @c True if queue is empty, @c False if it's not empty
+        """
+        return (self._num_items <= 0)
+
+
+    @micropython.native
+    def full (self):
+        """!
+        Check if the queue is full.
+        @return @c True if the queue is full
+        """
+        return (self._num_items >= self._size)
+
+
+    @micropython.native
+    def num_in (self):
+        """!
+        Check how many records are in the queue.
+        @return The number of records in the queue
+        """
+        return (self._num_items)
+
+
+    def clear (self):
+        """!
+        Remove all contents from the queue.
+        """
+        self._rd_idx = 0
+        self._wr_idx = 0
+        self._num_items = 0
+        self._max_full = 0
+        self._dropped = 0
+        self._blocked = 0
+        self._full_us = 0
+        self._full_since = -1
+
+
+    def stats (self):
+        """!
+        Get statistics about the queue's use in a form easily used by code,
+        as for @c Queue.stats().
+        @return A dictionary holding the queue's name, size, the numbers of
+                records now in the queue and at most, the numbers of dropped
+                records and blocked puts, and the time in milliseconds during
+                which the queue has been full
+        """
+        full_us = self._full_us
+        if self._full_since >= 0:
+            full_us += utime.ticks_diff (utime.ticks_us (), self._full_since)
+        return {'name' : self._name, 'size' : self._size, 
+                'num_in' : self._num_items, 'max_full' : self._max_full,
+                'dropped' : self._dropped, 'blocked' : self._blocked,
+                'full_ms' : full_us // 1000}
+
+
+    def __repr__ (self):
+        """!
+        This method puts diagnostic information about the queue into a string.
+
+        It shows the queue's name and record format, the maximum number of
+        records and queue size, and the numbers of dropped records and
+        blocked puts and the time for which the queue has been full. 
+        """
+        stats = self.stats ()
+        return ('{:<12s} RecordQueue<{:s}> Max Full {:d}/{:d} Dropped {:d} '
+                'Blocked {:d} Full {:d} ms'.format (self._name, 
+                self._type_code, self._max_full, self._size,
+                stats['dropped'], stats['blocked'], stats['full_ms']))
+
+
+# ============================================================================
+
+class Share (BaseShare):
+    """!
+    An item which holds data to be shared between tasks.
+    This class implements a shared data item which can be protected against
+    data corruption by pre-emptive multithreading. Multithreading which can
+    corrupt shared data includes the use of ordinary interrupts as well as the
+    use of pre-emptive multithreading such as by a Real-Time Operating System
+    (RTOS).
+ 
+    An example of the creation and use of a share is as follows:
+    @code
+    import task_share
+
+    # This share holds a signed short (16-bit) integer
+    my_share = task_share.Queue ('h', name="My Share")
+
+    # Somewhere in one task, put data into the share
+    my_share.put (some_data)
+
+    # In another task, read data from the share
+    something = my_share.get ()
+    @endcode
+    """
+    ## A counter used to give serial numbers to shares for diagnostic use.
+    ser_num = 0
+
+
+    def __init__ (self, type_code, thread_protect = True, name = None,
+                  timestamp = False):
+        """!
+        Create a shared data item used to transfer data between tasks.
+
+        This method allocates memory in which the shared data will be buffered.
+
+        Each share can only carry data of one particular type which must be
+        chosen from the following list. The data type is specified by a 
+        one-letter type code which is given as for the Python @c array.array
+        type, which can be any of the following:
+        |      |      |      |
+        |:-----|:-----|:-----|
+        | **b** (signed char) | **B** (unsigned char) | 8 bit integers |
+        | **h** (signed short) | **H** (unsigned short) | 16 bit integers |
+        | **i** (signed int) | **I** (unsigned int) | 32 bit integers (probably) |
+        | **l** (signed long) | **L** (unsigned long) | 32 bit integers |
+        | **q** (signed long long) | **Q** (unsigned long long) | 64 bit integers |
+        | **f** (float) | **d** (double-precision float) | |
+
+        @param type_code The type of data items which the share can hold
+        @param thread_protect True if mutual exclusion protection is used
+        @param name A short name for the share, default @c ShareN where @c N
+               is a serial number for the share
+        @param timestamp If @c True, the time at which data is put into the
+               share is saved so that the data's age can be found
+        """
+        # The name is chosen first so the share is registered under it
+        self._name = str (name) if name != None \
+            else 'Share' + str (Share.ser_num)
+        Share.ser_num += 1
+
+        # Then call the parent class initializer
+        super ().__init__ (type_code, thread_protect, name)
+
+        self._buffer = array.array (type_code, [0])
+
+        # The time from utime.ticks_us() at which the data was put here
+        self._timestamp = timestamp
+        self._stamp = utime.ticks_us ()
+
+        # A sequence number which is incremented each time data is put here
+        self._seq = 0
+
+
+    @micropython.native
+    def put (self, data, in_ISR = False, stamp = None):
+        """!
+        Write an item of data into the share.
+
+        This method puts data into the share; any old data is overwritten.
+        This code disables interrupts during the writing so as to prevent
+        data corrupting by an interrupt service routine which might access
+        the same data. Tasks set up with @c wake_on_put() are then woken.
+
+        If the share was created with @c timestamp set, the time is saved
+        with the data. Data which was computed from other timestamped data
+        can be given the timestamp of that data instead, so that the age
+        of a result shows how long ago the original measurement was taken:
+        @code
+        share_duty.put (control.update (share_pos.get ()),
+                        stamp = share_pos.stamp ())
+        @endcode
+        @param data The data to be put into this share
+        @param in_ISR Set this to True if calling from within an ISR
+        @param stamp A time from @c utime.ticks_us() to be saved with the
+               data, or @c None to use the current time
+        """
+
+        # Disable interrupts before writing the data
+        if self._thread_protect and not in_ISR:
+            irq_state = pyb.disable_irq ()
+
+        self._buffer[0] = data
+        self._seq = (self._seq + 1) & 0x3FFFFFFF
+        if self._timestamp:
+            self._stamp = utime.ticks_us () if stamp is None else stamp
+
+        # Re-enable interrupts
+        if self._thread_protect and not in_ISR:
+            pyb.enable_irq (irq_state)
+
+        # Wake up any tasks which are waiting for this data
+        if self._num_wake:
+            self._wake ()
+
+
+    @micropython.native
+    def get (self, in_ISR = False):
+        """!
+        Read an item of data from the share.
+
+        If thread protection is enabled, interrupts are disabled during the time
+        that the data is being read so as to prevent data corruption by changes
+        in the data as it is being read. 
+        @param in_ISR Set this to True if calling from within an ISR
+        """
+        # Disable interrupts before reading the data
+        if self._thread_protect and not in_ISR:
+            irq_state = pyb.disable_irq ()
+
+        to_return = self._buffer[0]
+
+        # Re-enable interrupts
+        if self._thread_protect and not in_ISR:
+            pyb.enable_irq (irq_state)
+
+        return (to_return)
+
+
+    @micropython.native
+    def seq (self):
+        """!
+        Get the share's sequence number, which is incremented (wrapping
+        around after 2<sup>30</sup>) every time data is put into the share.
+        @return The current sequence number
+        """
+        return self._seq
+
+
+    @micropython.native
+    def get_if_changed (self, last_seq, buf, in_ISR = False):
+        """!
+        Read the data in the share only if new data has been put there.
+
+        A task which only needs to do something when the data changes can
+        keep the sequence number of the data it last used and skip its work
+        when nothing new has arrived. The data is copied into a buffer made
+        once with @c new_buffer(), and the sequence number is read with the
+        data while interrupts are disabled, so the two always match and
+        nothing is allocated:
+        @code
+        |   data = my_share.new_buffer ()
+        |   last_seq = -1
+        |   while True:
+        |       seq = my_share.get_if_changed (last_seq, data)
+        |       if seq != last_seq:
+        |           last_seq = seq
+        |           do_something_with (data[0])
+        |       yield 0
+        @endcode
+        @param last_seq The sequence number of the data last used
+        @param buf An array with room for one item, into whose first element
+               the data is copied if it has changed
+        @param in_ISR Set this to True if calling from within an ISR
+        @return The sequence number of the data in the share, which equals
+                @c last_seq if nothing new has been put there
+        """
+        if self._seq == last_seq:
+            return last_seq
+
+        if self._thread_protect and not in_ISR:
+            irq_state = pyb.disable_irq ()
+
+        buf[0] = self._buffer[0]
+        to_return = self._seq
+
+        if self._thread_protect and not in_ISR:
+            pyb.enable_irq (irq_state)
+
+        return to_return
+
+
+    def new_buffer (self):
+        """!
+        Make a buffer of the right type to hold one item of this share's
+        data, for use with @c get_if_changed(). This should be done once,
+        when a task is set up, and the buffer reused.
+        @return A new one-item @c array
+        """
+        return array.array (self._type_code, [0])
+
+
+    def stamp (self):
+        """!
+        Get the time at which the data in the share was put there.
+        @return The time from @c utime.ticks_us() saved with the data, or
+                @c None if the share doesn't keep timestamps
+        """
+        if self._timestamp:
+            return self._stamp
+        return None
+
+
+    @micropython.native
+    def age (self):
+        """!
+        Find how long ago the data in the share was put there (or, if a
+        timestamp was passed to @c put(), how long ago that time was). This
+        method doesn't allocate memory.
+        @return The age of the data in microseconds, or @c None if the share
+                doesn't keep timestamps
+        """
+        if self._timestamp:
+            return utime.ticks_diff (utime.ticks_us (), self._stamp)
+        return None
+
+
+    def __repr__ (self):
         """!
         Puts diagnostic information about the share into a string.
 
@@ -437,3 +1489,611 @@ class Share (BaseShare):
         return ("{:<12s} Share<{:s}>".format (self._name,
                 type_code_strings[self._type_code]))
 
+
+# ============================================================================
+
+class StructShare (BaseShare):
+    """!
+    A group of named data items which are shared between tasks as one unit.
+
+    All the fields are kept in one buffer allocated when the share is
+    created. Several fields can be changed at once with @c update(), and a
+    consistent copy of all the fields can be taken with @c snapshot(), each
+    with interrupts disabled only once. A task reading the snapshot can then
+    never see some fields from before an update and some from after it,
+    as could happen if each item were kept in its own @c Share.
+
+    An example of the creation and use of a structure share is as follows:
+    @code
+    import task_share
+
+    axis = task_share.StructShare ((('setpoint', 'f'), ('position', 'f'),
+                                    ('duty', 'i'), ('stop', 'B')),
+                                   name = "Axis 1")
+
+    # In one task, update some of the fields together
+    axis.update (position = new_position, duty = new_duty)
+
+    # In a task which runs often, write one field without allocating memory
+    POSITION = axis.field_index ('position')
+    ...
+    axis.update_at (POSITION, new_position)
+
+    # In another task, copy all the fields into a buffer made once
+    state = axis.new_buffer ()
+    ...
+    axis.snapshot (state)
+    position = axis.field (state, 'position')
+    setpoint = axis.field (state, 'setpoint')
+    @endcode
+    """
+    ## A counter used to give serial numbers to shares for diagnostic use.
+    ser_num = 0
+
+
+    def __init__ (self, fields, thread_protect = True, name = None):
+        """!
+        Create a structure share with the given fields.
+        @param fields A sequence of (name, type code) pairs, one for each
+               field, where the type codes are those used by @c struct, 
+               such as @c 'i' or @c 'f'
+        @param thread_protect True if mutual exclusion protection is used
+        @param name A short name for the share, default @c StructShareN where
+               @c N is a serial number for the share
+        """
+        # The fields are packed with standard sizes and no padding
+        fmt = '<' + ''.join ([code for fname, code in fields])
+        self._name = str (name) if name != None \
+            else 'StructShare' + str (StructShare.ser_num)
+        StructShare.ser_num += 1
+        super ().__init__ (fmt, thread_protect, name)
+
+        # Find each field's offset and format within the buffer. They are
+        # kept by name and also in tuples indexed by field number, which
+        # update_at() uses
+        self._field_names = tuple ([fname for fname, code in fields])
+        self._fields = {}
+        offsets = []
+        formats = []
+        offset = 0
+        for fname, code in fields:
+            self._fields[fname] = (offset, '<' + code)
+            offsets.append (offset)
+            formats.append ('<' + code)
+            offset += struct.calcsize ('<' + code)
+        self._offsets = tuple (offsets)
+        self._formats = tuple (formats)
+
+        ## The number of bytes taken by all the fields together
+        self.size = offset
+        self._buffer = bytearray (self.size)
+
+
+    def update (self, in_ISR = False, **fields):
+        """!
+        Write new values into one or more fields at once.
+        All the fields are written with interrupts disabled only once, and
+        tasks set up with @c wake_on_put() are then woken. The keywords are
+        gathered into a new dictionary each time, so tasks which write a
+        field every time they run should use @c update_at() or 
+        @c put_field() instead.
+        @param in_ISR Set this to True if calling from within an ISR
+        @param fields The new values, given as @c name=value keywords
+        """
+        if self._thread_protect and not in_ISR:
+            irq_state = pyb.disable_irq ()
+
+        for fname in fields:
+            offset, fmt = self._fields[fname]
+            struct.pack_into (fmt, self._buffer, offset, fields[fname])
+
+        if self._thread_protect and not in_ISR:
+            pyb.enable_irq (irq_state)
+
+        if self._num_wake:
+            self._wake ()
+
+
+    def field_index (self, fname):
+        """!
+        Find the number of a field, for use with @c update_at(). This should
+        be done once, when a task is set up.
+        @param fname The name of the field
+        @return The index of the field, counting from 0 in the order in
+                which the fields were given
+        """
+        return self._field_names.index (fname)
+
+
+    @micropython.native
+    def update_at (self, index, value, in_ISR = False):
+        """!
+        Write a new value into one field chosen by its number. This doesn't
+        allocate memory, so it suits tasks which write the field every time
+        they run. Tasks set up with @c wake_on_put() are then woken.
+        @param index The number of the field, as from @c field_index()
+        @param value The new value of the field
+        @param in_ISR Set this to True if calling from within an ISR
+        """
+        if self._thread_protect and not in_ISR:
+            irq_state = pyb.disable_irq ()
+
+        struct.pack_into (self._formats[index], self._buffer,
+                          self._offsets[index], value)
+
+        if self._thread_protect and not in_ISR:
+            pyb.enable_irq (irq_state)
+
+        if self._num_wake:
+            self._wake ()
+
+
+    def put_field (self, fname, value, in_ISR = False):
+        """!
+        Write a new value into one field chosen by its name. Unlike
+        @c update(), this doesn't make a dictionary of keywords, so it can be
+        used in a task which runs often.
+        @param fname The name of the field
+        @param value The new value of the field
+        @param in_ISR Set this to True if calling from within an ISR
+        """
+        offset, fmt = self._fields[fname]
+        if self._thread_protect and not in_ISR:
+            irq_state = pyb.disable_irq ()
+
+        struct.pack_into (fmt, self._buffer, offset, value)
+
+        if self._thread_protect and not in_ISR:
+            pyb.enable_irq (irq_state)
+
+        if self._num_wake:
+            self._wake ()
+
+
+    def get (self, fname, in_ISR = False):
+        """!
+        Read the value of one field.
+        @param fname The name of the field
+        @param in_ISR Set this to True if calling from within an ISR
+        @return The field's value
+        """
+        offset, fmt = self._fields[fname]
+        if self._thread_protect and not in_ISR:
+            irq_state = pyb.disable_irq ()
+
+        to_return = struct.unpack_from (fmt, self._buffer, offset)[0]
+
+        if self._thread_protect and not in_ISR:
+            pyb.enable_irq (irq_state)
+        return to_return
+
+
+    def new_buffer (self):
+        """!
+        Make a buffer of the right size to hold a snapshot of this share.
+        This should be done once, when a task is set up, and the buffer
+        reused for each snapshot.
+        @return A new @c bytearray large enough for all the fields
+        """
+        return bytearray (self.size)
+
+
+    @micropython.native
+    def snapshot (self, buf, in_ISR = False):
+        """!
+        Copy all the fields into a buffer as one consistent set of values.
+        The copy is made with interrupts disabled once and doesn't allocate
+        memory. Field values can then be read from the buffer with 
+        @c field() or @c unpack() at leisure.
+        @param buf A @c bytearray of at least @c size bytes, such as one made
+               by @c new_buffer()
+        @param in_ISR Set this to True if calling from within an ISR
+        @return The buffer @c buf
+        """
+        if self._thread_protect and not in_ISR:
+            irq_state = pyb.disable_irq ()
+
+        buf[0:self.size] = self._buffer
+
+        if self._thread_protect and not in_ISR:
+            pyb.enable_irq (irq_state)
+        return buf
+
+
+    def field (self, buf, fname):
+        """!
+        Read one field's value from a buffer filled by @c snapshot().
+        @param buf The buffer holding a snapshot of this share
+        @param fname The name of the field
+        @return The field's value
+        """
+        offset, fmt = self._fields[fname]
+        return struct.unpack_from (fmt, buf, offset)[0]
+
+
+    def unpack (self, buf):
+        """!
+        Read all the fields' values from a buffer filled by @c snapshot().
+        @param buf The buffer holding a snapshot of this share
+        @return A tuple of the values of all the fields, in order
+        """
+        return struct.unpack_from (self._type_code, buf, 0)
+
+
+    def __repr__ (self):
+        """!
+        Puts diagnostic information about the share into a string, showing
+        its name and the names and types of its fields.
+        """
+        return ("{:<12s} StructShare<{:s}>".format (self._name, ','.join (
+                [fname + ':' + self._fields[fname][1][1:] 
+                 for fname in self._field_names])))
+
+
+# ============================================================================
+
+class ArrayShare (BaseShare):
+    """!
+    A share holding an array of numbers which are all put at the same time.
+
+    One task which measures several things at once, such as the positions of
+    several motors, can put all the values with one call to @c put_all().
+    Interrupts are disabled only once, one sequence number and (unless a
+    time is given for each value) one timestamp are given to all the
+    values, and tasks set up with @c wake_on_put() are woken once. Each
+    value keeps its own sequence number and timestamp, so when one value is
+    put by itself with @c put(), the others are unchanged and don't look new
+    to the tasks which use them.
+
+    Each value can also be used through an @c ArrayItem, which has the same
+    methods as a @c Share, so a task written to use a @c Share needn't be
+    changed to use one value in an array share:
+    @code
+    import task_share
+
+    positions = task_share.ArrayShare ('i', 2, name = "Positions",
+                                       timestamp = True)
+
+    # In one task, put all the positions
+    positions.put_all (new_positions)
+
+    # In another task, read one of them as if it were a Share
+    share_pos_1 = positions.item (0)
+    position = share_pos_1.get ()
+    @endcode
+
+    Each item is registered in @c numeric_list with a name such as
+    @c Positions[0], so @c snapshot_all() includes all the values.
+    """
+    ## A counter used to give serial numbers to shares for diagnostic use.
+    ser_num = 0
+
+
+    def __init__ (self, type_code, size, thread_protect = True, name = None,
+                  timestamp = False):
+        """!
+        Create an array share, allocating memory for all its values.
+        @param type_code The type of data items which the share can hold,
+               given as for a @c Share
+        @param size The number of values in the array
+        @param thread_protect True if mutual exclusion protection is used
+        @param name A short name for the share, default @c ArrayShareN where
+               @c N is a serial number for the share
+        @param timestamp If @c True, the time at which data is put into the
+               share is saved so that the data's age can be found
+        """
+        # The name is chosen first so the share is registered under it
+        self._name = str (name) if name != None \
+            else 'ArrayShare' + str (ArrayShare.ser_num)
+        ArrayShare.ser_num += 1
+
+        # Then call the parent class initializer
+        super ().__init__ (type_code, thread_protect, name)
+
+        ## The number of values in the array
+        self.size = size
+        self._buffer = array.array (type_code, [0] * size)
+
+        # The sequence number of the last put of any kind, and the sequence
+        # number and timestamp of each value
+        self._timestamp = timestamp
+        self._seq = 0
+        self._seqs = array.array ('l', [0] * size)
+        self._stamps = array.array ('l', [utime.ticks_us ()] * size)
+
+        # Make an item for each value and register it as a numeric share
+        self._items = tuple ([ArrayItem (self, idx) for idx in range (size)])
+        for item in self._items:
+            share_dict[item._name] = item
+            _add_numeric (item, type_code)
+
+
+    @micropython.native
+    def put_all (self, values, in_ISR = False, stamp = None, stamps = None):
+        """!
+        Write all the values in the array at once.
+        The values are copied with interrupts disabled once and no memory is
+        allocated; then tasks set up with @c wake_on_put() are woken.
+        @param values An array or list holding at least @c size values
+        @param in_ISR Set this to True if calling from within an ISR
+        @param stamp A time from @c utime.ticks_us() to be saved with the
+               data, or @c None to use the current time
+        @param stamps An array holding a time from @c utime.ticks_us() for
+               each value, for values which were measured at different
+               times, or @c None to give all the values the same time
+        """
+        if self._thread_protect and not in_ISR:
+            irq_state = pyb.disable_irq ()
+
+        seq = (self._seq + 1) & 0x3FFFFFFF
+        self._seq = seq
+        if self._timestamp and stamp is None:
+            stamp = utime.ticks_us ()
+        idx = 0
+        while idx < self.size:
+            self._buffer[idx] = values[idx]
+            self._seqs[idx] = seq
+            if self._timestamp:
+                self._stamps[idx] = stamp if stamps is None else stamps[idx]
+            idx += 1
+
+        if self._thread_protect and not in_ISR:
+            pyb.enable_irq (irq_state)
+
+        if self._num_wake:
+            self._wake ()
+
+
+    @micropython.native
+    def put (self, index, data, in_ISR = False, stamp = None):
+        """!
+        Write one value in the array. Only that value's sequence number and
+        timestamp are changed, and tasks set up with @c wake_on_put() are
+        woken.
+        @param index The index of the value to be written
+        @param data The data to be put into the array
+        @param in_ISR Set this to True if calling from within an ISR
+        @param stamp A time from @c utime.ticks_us() to be saved with the
+               data, or @c None to use the current time
+        """
+        if self._thread_protect and not in_ISR:
+            irq_state = pyb.disable_irq ()
+
+        self._buffer[index] = data
+        self._seq = (self._seq + 1) & 0x3FFFFFFF
+        self._seqs[index] = self._seq
+        if self._timestamp:
+            self._stamps[index] = utime.ticks_us () if stamp is None else stamp
+
+        if self._thread_protect and not in_ISR:
+            pyb.enable_irq (irq_state)
+
+        if self._num_wake:
+            self._wake ()
+
+
+    @micropython.native
+    def get (self, index, in_ISR = False):
+        """!
+        Read one value from the array.
+        @param index The index of the value to be read
+        @param in_ISR Set this to True if calling from within an ISR
+        @return The value
+        """
+        if self._thread_protect and not in_ISR:
+            irq_state = pyb.disable_irq ()
+
+        to_return = self._buffer[index]
+
+        if self._thread_protect and not in_ISR:
+            pyb.enable_irq (irq_state)
+        return to_return
+
+
+    @micropython.native
+    def get_into (self, buf, in_ISR = False):
+        """!
+        Copy all the values into an array as one consistent set.
+        The copy is made with interrupts disabled once and doesn't allocate
+        memory.
+        @param buf An array or list with room for at least @c size values
+        @param in_ISR Set this to True if calling from within an ISR
+        @return The sequence number of the values which were copied
+        """
+        if self._thread_protect and not in_ISR:
+            irq_state = pyb.disable_irq ()
+
+        idx = 0
+        while idx < self.size:
+            buf[idx] = self._buffer[idx]
+            idx += 1
+        to_return = self._seq
+
+        if self._thread_protect and not in_ISR:
+            pyb.enable_irq (irq_state)
+        return to_return
+
+
+    def item (self, index):
+        """!
+        Get the item through which one value can be used like a @c Share.
+        Items are made when the array share is created, so this doesn't
+        allocate memory.
+        @param index The index of the value
+        @return The @c ArrayItem for that value
+        """
+        return self._items[index]
+
+
+    @micropython.native
+    def seq (self, index = None):
+        """!
+        Get a sequence number, which is incremented (wrapping around after
+        2<sup>30</sup>) every time data is put into the share.
+        @param index The index of a value, or @c None for the whole array
+        @return The sequence number of the last data put into that value,
+                or into any value if @c index is @c None
+        """
+        if index is None:
+            return self._seq
+        return self._seqs[index]
+
+
+    def stamp (self, index = 0):
+        """!
+        Get the time at which a value in the share was put there.
+        @param index The index of the value
+        @return The time from @c utime.ticks_us() saved with the data, or
+                @c None if the share doesn't keep timestamps
+        """
+        if self._timestamp:
+            return self._stamps[index]
+        return None
+
+
+    @micropython.native
+    def age (self, index = 0):
+        """!
+        Find how long ago a value in the share was put there. This method
+        doesn't allocate memory.
+        @param index The index of the value
+        @return The age of the data in microseconds, or @c None if the share
+                doesn't keep timestamps
+        """
+        if self._timestamp:
+            return utime.ticks_diff (utime.ticks_us (), self._stamps[index])
+        return None
+
+
+    def __repr__ (self):
+        """!
+        Puts diagnostic information about the share into a string, showing
+        its name, type and size.
+        """
+        return ("{:<12s} ArrayShare<{:s}>[{:d}]".format (self._name,
+                type_code_strings[self._type_code], self.size))
+
+
+# ============================================================================
+
+class ArrayItem:
+    """!
+    One value in an @c ArrayShare, used as if it were a @c Share.
+
+    Items are made by the array share; use @c ArrayShare.item() to get one.
+    Each item has its own sequence number and timestamp, but the tasks woken
+    on a put belong to the whole array, so putting data through one item
+    wakes the tasks set up with @c wake_on_put() on any item of the array.
+    """
+
+    def __init__ (self, parent, index):
+        """!
+        Create an item for one value in an array share.
+        @param parent The @c ArrayShare which holds the value
+        @param index The index of the value in the array
+        """
+        self._parent = parent
+        self._index = index
+        self._name = parent._name + '[' + str (index) + ']'
+
+        # A one-value view of the parent's buffer, read by snapshot_all()
+        self._buffer = memoryview (parent._buffer)[index:index + 1]
+
+
+    def put (self, data, in_ISR = False, stamp = None):
+        """!
+        Write the value into the array share.
+        @param data The data to be put into the share
+        @param in_ISR Set this to True if calling from within an ISR
+        @param stamp A time from @c utime.ticks_us() to be saved with the
+               data, or @c None to use the current time
+        """
+        self._parent.put (self._index, data, in_ISR, stamp)
+
+
+    def get (self, in_ISR = False):
+        """!
+        Read the value from the array share.
+        @param in_ISR Set this to True if calling from within an ISR
+        @return The value
+        """
+        return self._parent.get (self._index, in_ISR)
+
+
+    def seq (self):
+        """!
+        Get the sequence number of this value.
+        @return The current sequence number
+        """
+        return self._parent._seqs[self._index]
+
+
+    @micropython.native
+    def get_if_changed (self, last_seq, buf, in_ISR = False):
+        """!
+        Read the value only if new data has been put into it, as with
+        @c Share.get_if_changed().
+        @param last_seq The sequence number of the data last used
+        @param buf An array with room for one item, into whose first element
+               the value is copied if it has changed
+        @param in_ISR Set this to True if calling from within an ISR
+        @return The sequence number of this value, which equals @c last_seq
+                if nothing new has been put into it
+        """
+        parent = self._parent
+        index = self._index
+        if parent._seqs[index] == last_seq:
+            return last_seq
+
+        if parent._thread_protect and not in_ISR:
+            irq_state = pyb.disable_irq ()
+
+        buf[0] = parent._buffer[index]
+        to_return = parent._seqs[index]
+
+        if parent._thread_protect and not in_ISR:
+            pyb.enable_irq (irq_state)
+
+        return to_return
+
+
+    def new_buffer (self):
+        """!
+        Make a buffer of the right type to hold this value, for use with
+        @c get_if_changed().
+        @return A new one-item @c array
+        """
+        return array.array (self._parent._type_code, [0])
+
+
+    def stamp (self):
+        """!
+        Get the time at which this value was put into the array share.
+        @return The time from @c utime.ticks_us(), or @c None if the share
+                doesn't keep timestamps
+        """
+        return self._parent.stamp (self._index)
+
+
+    def age (self):
+        """!
+        Find how long ago this value was put into the array share.
+        @return The age of the data in microseconds, or @c None if the share
+                doesn't keep timestamps
+        """
+        return self._parent.age (self._index)
+
+
+    def wake_on_put (self, *tasks):
+        """!
+        Make tasks ready to run whenever data is put into the array share.
+        @param tasks One or more @c cotask.Task objects to be woken
+        """
+        self._parent.wake_on_put (*tasks)
+
+
+    def __repr__ (self):
+        """!
+        Puts the name of the item and its value into a string.
+        """
+        return "{:<12s} ArrayItem = {}".format (self._name, self._buffer[0])